@@ -0,0 +1,98 @@
+"""
+Bindings for the C AI engine (verdant_backend.so)
+"""
+import ctypes
+import os
+import sys
+import threading
+import numpy as np
+
+# Load C library for performance-critical AI operations
+# Note: We use C for K-Means, TSP, and nutrition scoring (10-100x faster than Python)
+base_dir = os.path.dirname(os.path.abspath(__file__))
+lib_file = "verdant_backend.dll" if sys.platform.startswith('win') else "verdant_backend.so"
+lib_path = os.path.join(base_dir, lib_file)
+
+lib = None
+if not os.path.exists(lib_path):
+    print(f"[WARNING] C library not found: {lib_file}")
+    print("[INFO] Server will start but AI features will be disabled")
+    print("[FIX] Rebuild with: docker-compose up -d --build backend")
+else:
+    try:
+        lib = ctypes.CDLL(lib_path)
+        print(f"[SUCCESS] C library loaded: {lib_file}")
+    except OSError as e:
+        print(f"[WARNING] Error loading C library: {e}")
+        print("[INFO] Server will start but AI features will be disabled")
+
+# Output buffer sizes, large enough for each function's JSON
+ROUTE_BUFFER_SIZE = 8192
+NUTRITION_BUFFER_SIZE = 2048
+AUDIT_BUFFER_SIZE = 1024
+CLUSTER_BUFFER_SIZE = 16384
+
+# Output buffers are allocated once per thread and reused. The C functions
+# NUL-terminate what they write and .value stops at the first NUL, so earlier
+# output never leaks into a later result.
+_buffers = threading.local()
+
+def _buffer(name, size):
+    buffer = getattr(_buffers, name, None)
+    if buffer is None:
+        buffer = ctypes.create_string_buffer(size)
+        setattr(_buffers, name, buffer)
+    return buffer
+
+# C function bindings. Every prototype is declared in full, and restype is None
+# because the C functions return void, so ctypes skips the int conversion on
+# return. The bound function pointers are resolved once here, not per request.
+# CDLL calls release the GIL and the C functions keep no shared state, so the
+# wrappers are safe to run from worker threads.
+if lib:
+    _optimize_route = lib.optimize_route
+    _optimize_route.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    _optimize_route.restype = None
+
+    _analyze_nutrition = lib.analyze_nutrition
+    _analyze_nutrition.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    _analyze_nutrition.restype = None
+
+    _calculate_daily_audit = lib.calculate_daily_audit
+    _calculate_daily_audit.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    _calculate_daily_audit.restype = None
+
+    _perform_clustering = lib.perform_clustering
+    _perform_clustering.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int), ctypes.c_char_p, ctypes.c_int]
+    _perform_clustering.restype = None
+
+def optimize_route(stops):
+    """Optimized delivery route (2-Opt) as JSON bytes"""
+    buffer = _buffer('route', ROUTE_BUFFER_SIZE)
+    _optimize_route(stops, buffer, ROUTE_BUFFER_SIZE)
+    return buffer.value
+
+def analyze_nutrition(protein, carbs, fat, fiber, sodium):
+    """Bio-score and verdict for a meal as JSON bytes"""
+    buffer = _buffer('nutrition', NUTRITION_BUFFER_SIZE)
+    _analyze_nutrition(protein, carbs, fat, fiber, sodium, buffer, NUTRITION_BUFFER_SIZE)
+    return buffer.value
+
+def calculate_daily_audit(points, protein_consumed, protein_goal, carbs_consumed, carbs_goal):
+    """Daily habit audit and point penalty as JSON bytes"""
+    buffer = _buffer('audit', AUDIT_BUFFER_SIZE)
+    _calculate_daily_audit(points, protein_consumed, protein_goal, carbs_consumed, carbs_goal,
+                           buffer, AUDIT_BUFFER_SIZE)
+    return buffer.value
+
+def perform_clustering(points, wallets):
+    """K-Means customer segments for parallel points/wallet sequences as JSON bytes"""
+    # Contiguous int32 arrays are handed to C as pointers, without per-element copies
+    points_array = np.ascontiguousarray(points, dtype=np.int32)
+    wallets_array = np.ascontiguousarray(wallets, dtype=np.int32)
+    buffer = _buffer('cluster', CLUSTER_BUFFER_SIZE)
+    _perform_clustering(len(points_array),
+                        points_array.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                        wallets_array.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                        buffer, CLUSTER_BUFFER_SIZE)
+    return buffer.value
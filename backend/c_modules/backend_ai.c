@@ -4,7 +4,8 @@
 #define MAX_ITERATIONS 50
 #define CONVERGENCE_THRESHOLD 0.01
 
-static float centroids[NUM_CLUSTERS][2] = {
+// Starting centroids; each call copies them so concurrent calls share no state
+static const float initial_centroids[NUM_CLUSTERS][2] = {
     {30.0, 30.0},      // Bronze: Low Eco, Low Spend (casual users)
     {150.0, 30.0},     // Silver: High Eco, Low Spend (eco-warriors on budget)
     {30.0, 500.0},     // Gold: Low Eco, High Spend (high spenders)
@@ -29,7 +30,7 @@ static float calculate_churn_risk(int wallet_balance) {
 }
 
 static int assign_clusters(int count, const int* points, const int* wallets, 
-                           int* assignments) {
+                           float centroids[NUM_CLUSTERS][2], int* assignments) {
     int changed = 0;
     
     for (int i = 0; i < count; i++) {
@@ -61,7 +62,7 @@ static int assign_clusters(int count, const int* points, const int* wallets,
 
 
 static float update_centroids(int count, const int* points, const int* wallets,
-                              const int* assignments) {
+                              float centroids[NUM_CLUSTERS][2], const int* assignments) {
     float new_centroids[NUM_CLUSTERS][2] = {{0}};
     int cluster_counts[NUM_CLUSTERS] = {0};
     float max_movement = 0.0f;
@@ -129,15 +130,18 @@ EXPORT void perform_clustering(int count, int* points, int* wallets,
     }
     
     // Run K-Means algorithm
+    float centroids[NUM_CLUSTERS][2];
+    memcpy(centroids, initial_centroids, sizeof(centroids));
+    
     int iteration = 0;
     int converged = 0;
     
     while (iteration < MAX_ITERATIONS && !converged) {
         // Assign points to clusters
-        int changed = assign_clusters(count, points, wallets, assignments);
+        int changed = assign_clusters(count, points, wallets, centroids, assignments);
         
         // Update centroids
-        float movement = update_centroids(count, points, wallets, assignments);
+        float movement = update_centroids(count, points, wallets, centroids, assignments);
         
         // Check convergence
         if (!changed || movement < CONVERGENCE_THRESHOLD) {
@@ -151,23 +155,22 @@ EXPORT void perform_clustering(int count, int* points, int* wallets,
     int offset = 0;
     offset += snprintf(output_buffer + offset, buffer_size - offset, "[");
     
-    for (int i = 0; i < count && offset < buffer_size - 150; i++) {
+    // Elements are separated before, not after, and each one must leave room
+    // for the closing "]" and NUL, so a full buffer still ends in valid JSON
+    for (int i = 0; i < count; i++) {
         int cluster = assignments[i];
         float churn = calculate_churn_risk(wallets[i]);
         
         int written = snprintf(output_buffer + offset, buffer_size - offset,
-            "{\"x\":%d,\"y\":%d,\"cluster\":\"%s\",\"churn\":%.1f}",
-            points[i], wallets[i], cluster_names[cluster], churn);
+            "%s{\"x\":%d,\"y\":%d,\"cluster\":\"%s\",\"churn\":%.1f}",
+            i > 0 ? "," : "", points[i], wallets[i], cluster_names[cluster], churn);
         
-        if (written < 0 || written >= buffer_size - offset) {
+        if (written < 0 || written >= buffer_size - offset - 1) {
+            output_buffer[offset] = '\0';
             break; // Buffer overflow protection
         }
         
         offset += written;
-        
-        if (i < count - 1 && offset < buffer_size - 2) {
-            output_buffer[offset++] = ',';
-        }
     }
     
     if (offset < buffer_size - 1) {
@@ -9,6 +9,8 @@
 #define MAX_STOPS 100
 #define MAX_ITERATIONS 200
 #define GRID_SIZE 100.0
+#define NEIGHBOR_K 20
+#define IMPROVEMENT_EPSILON 0.001
 
 typedef struct {
     int id;
@@ -43,24 +45,95 @@ static double calculate_route_distance(const DeliveryNode* nodes, const int* rou
 }
 
 /**
- * Perform 2-opt swap: reverse segment between indices i and j
+ * Reverse route[i..j] in place and keep the position index in sync
  */
-static void two_opt_swap(const int* route, int i, int j, int count, int* new_route) {
-    // Copy first segment unchanged
-    for (int k = 0; k < i; k++) {
-        new_route[k] = route[k];
+static void reverse_segment(int* route, int* pos, int i, int j) {
+    while (i < j) {
+        int tmp = route[i];
+        route[i] = route[j];
+        route[j] = tmp;
+        pos[route[i]] = i;
+        pos[route[j]] = j;
+        i++;
+        j--;
     }
-    
-    // Reverse middle segment
-    int idx = i;
-    for (int k = j; k >= i; k--) {
-        new_route[idx++] = route[k];
+}
+
+/**
+ * Build each node's list of its k nearest other nodes, closest first
+ */
+static void build_neighbor_lists(const DeliveryNode* nodes, int count, int k, int* neighbors) {
+    double* dist = (double*)malloc(k * sizeof(double));
+    if (!dist) {
+        // Fallback: unsorted neighbors still give a valid (if weaker) search
+        for (int i = 0; i < count; i++) {
+            for (int n = 0; n < k; n++) {
+                neighbors[i * k + n] = (i + 1 + n) % count;
+            }
+        }
+        return;
     }
-    
-    // Copy last segment unchanged
-    for (int k = j + 1; k < count; k++) {
-        new_route[k] = route[k];
+
+    for (int i = 0; i < count; i++) {
+        int* list = &neighbors[i * k];
+        int filled = 0;
+
+        // Insertion into a sorted top-k list
+        for (int j = 0; j < count; j++) {
+            if (j == i) continue;
+            double d = calculate_distance(&nodes[i], &nodes[j]);
+            if (filled == k && d >= dist[k - 1]) continue;
+
+            int slot = (filled < k) ? filled++ : k - 1;
+            while (slot > 0 && dist[slot - 1] > d) {
+                dist[slot] = dist[slot - 1];
+                list[slot] = list[slot - 1];
+                slot--;
+            }
+            dist[slot] = d;
+            list[slot] = j;
+        }
+    }
+
+    free(dist);
+}
+
+/**
+ * Try the 2-opt move that replaces edges (route[p], route[p+1]) and
+ * (route[q], route[q+1]) with (route[p], route[q]) and (route[p+1], route[q+1]).
+ * Only the four touched edges are compared, so each candidate is O(1).
+ * Applies the move and returns the gain if it improves the tour, else 0.
+ */
+static double try_two_opt_move(const DeliveryNode* nodes, int* route, int* pos, int count, int p, int q) {
+    if (p > q) {
+        int tmp = p;
+        p = q;
+        q = tmp;
     }
+    // Adjacent edges share a node; reversing between them changes nothing
+    if (q - p < 2 || (p == 0 && q == count - 1)) return 0.0;
+
+    const DeliveryNode* a = &nodes[route[p]];
+    const DeliveryNode* b = &nodes[route[p + 1]];
+    const DeliveryNode* c = &nodes[route[q]];
+    const DeliveryNode* d = &nodes[route[(q + 1) % count]];
+
+    double gain = calculate_distance(a, b) + calculate_distance(c, d)
+                - calculate_distance(a, c) - calculate_distance(b, d);
+    if (gain <= IMPROVEMENT_EPSILON) return 0.0;
+
+    // p + 1 >= 1, so the hub at position 0 never moves
+    reverse_segment(route, pos, p + 1, q);
+    return gain;
+}
+
+/**
+ * Portable reentrant PRNG (the POSIX rand() reference LCG) on caller-owned state,
+ * so concurrent calls don't share the global rand() seed
+ */
+static inline int next_random(unsigned int* state) {
+    *state = *state * 1103515245u + 12345u;
+    return (int)((*state / 65536u) % 32768u);
 }
 
 /**
@@ -74,13 +147,13 @@ static void generate_delivery_locations(DeliveryNode* nodes, int count, unsigned
     strcpy(nodes[0].type, "HUB");
     
     // Use provided seed for reproducibility
-    srand(seed);
+    unsigned int state = seed;
     
     // Generate random delivery points
     for (int i = 1; i < count; i++) {
         nodes[i].id = i;
-        nodes[i].x = (double)(rand() % (int)GRID_SIZE);
-        nodes[i].y = (double)(rand() % (int)GRID_SIZE);
+        nodes[i].x = (double)(next_random(&state) % (int)GRID_SIZE);
+        nodes[i].y = (double)(next_random(&state) % (int)GRID_SIZE);
         strcpy(nodes[i].type, "DROP");
     }
 }
@@ -145,16 +218,23 @@ EXPORT void optimize_route(int num_stops, char* output_buffer, int buffer_size)
     if (num_stops > MAX_STOPS) num_stops = MAX_STOPS;
     
     // Allocate memory
+    int k = (num_stops - 1 < NEIGHBOR_K) ? num_stops - 1 : NEIGHBOR_K;
     DeliveryNode* nodes = (DeliveryNode*)malloc(num_stops * sizeof(DeliveryNode));
     int* route = (int*)malloc(num_stops * sizeof(int));
-    int* new_route = (int*)malloc(num_stops * sizeof(int));
+    int* pos = (int*)malloc(num_stops * sizeof(int));
+    int* neighbors = (int*)malloc(num_stops * k * sizeof(int));
+    int* queue = (int*)malloc(num_stops * sizeof(int));
+    char* queued = (char*)calloc(num_stops, sizeof(char));
     
-    if (!nodes || !route || !new_route) {
+    if (!nodes || !route || !pos || !neighbors || !queue || !queued) {
         snprintf(output_buffer, buffer_size, 
                 "{\"error\":\"Memory allocation failed\"}");
         free(nodes);
         free(route);
-        free(new_route);
+        free(pos);
+        free(neighbors);
+        free(queue);
+        free(queued);
         return;
     }
     
@@ -163,35 +243,64 @@ EXPORT void optimize_route(int num_stops, char* output_buffer, int buffer_size)
     
     // Initialize route with nearest neighbor heuristic
     initialize_route_nearest_neighbor(nodes, route, num_stops);
+    for (int i = 0; i < num_stops; i++) pos[route[i]] = i;
+    
+    // Only the k nearest nodes are considered as new neighbors in a move
+    build_neighbor_lists(nodes, num_stops, k, neighbors);
+    
+    // Run 2-Opt optimization with don't-look bits: a node is only re-examined
+    // after an improving move touches it, via a FIFO work queue
+    int head = 0, queued_count = num_stops;
+    for (int i = 0; i < num_stops; i++) {
+        queue[i] = route[i];
+        queued[route[i]] = 1;
+    }
     
-    // Run 2-Opt optimization
-    double best_distance = calculate_route_distance(nodes, route, num_stops);
-    int improved = 1;
     int iteration = 0;
+    int max_moves = MAX_ITERATIONS * num_stops;
     
-    while (improved && iteration < MAX_ITERATIONS) {
-        improved = 0;
-        iteration++;
+    while (queued_count > 0 && iteration < max_moves) {
+        int a = queue[head];
+        head = (head + 1) % num_stops;
+        queued_count--;
+        queued[a] = 0;
         
-        // Try all possible 2-opt swaps
-        for (int i = 1; i < num_stops - 1; i++) {
-            for (int j = i + 1; j < num_stops; j++) {
-                // Create new route with swap
-                two_opt_swap(route, i, j, num_stops, new_route);
-                
-                // Calculate new distance
-                double new_distance = calculate_route_distance(nodes, new_route, num_stops);
+        int improved = 0;
+        for (int dir = 0; dir < 2 && !improved; dir++) {
+            // dir 0: new edge joins a and its neighbor c, both tours continuing forward
+            // dir 1: the same, but from their predecessors
+            int pa = dir == 0 ? pos[a] : (pos[a] - 1 + num_stops) % num_stops;
+            int pa_next = (pa + 1) % num_stops;
+            double current = calculate_distance(&nodes[route[pa]], &nodes[route[pa_next]]);
+            
+            for (int n = 0; n < k; n++) {
+                int c = neighbors[a * k + n];
+                // Neighbors are sorted, so no later one can shorten this edge
+                if (calculate_distance(&nodes[a], &nodes[c]) >= current) break;
                 
-                // Accept if improvement found
-                if (new_distance < best_distance - 0.001) { // Small epsilon for float comparison
-                    memcpy(route, new_route, num_stops * sizeof(int));
-                    best_distance = new_distance;
+                int pc = dir == 0 ? pos[c] : (pos[c] - 1 + num_stops) % num_stops;
+                int p = pa, q = pc;
+                if (try_two_opt_move(nodes, route, pos, num_stops, p, q) > 0.0) {
+                    // Re-examine the endpoints of the four changed edges
+                    int lo = p < q ? p : q, hi = p < q ? q : p;
+                    int touched[4] = { route[lo], route[lo + 1], route[hi], route[(hi + 1) % num_stops] };
+                    for (int t = 0; t < 4; t++) {
+                        if (!queued[touched[t]]) {
+                            queue[(head + queued_count) % num_stops] = touched[t];
+                            queued[touched[t]] = 1;
+                            queued_count++;
+                        }
+                    }
+                    iteration++;
                     improved = 1;
+                    break;
                 }
             }
         }
     }
     
+    double best_distance = calculate_route_distance(nodes, route, num_stops);
+    
     // Build JSON output
     int offset = 0;
     offset += snprintf(output_buffer + offset, buffer_size - offset,
@@ -222,5 +331,8 @@ EXPORT void optimize_route(int num_stops, char* output_buffer, int buffer_size)
     // Cleanup
     free(nodes);
     free(route);
-    free(new_route);
+    free(pos);
+    free(neighbors);
+    free(queue);
+    free(queued);
 }
@@ -1,16 +1,17 @@
 """
-Database connection and helper functions for PostgreSQL
+Database connection and helper functions for PostgreSQL (asyncpg)
 """
-import psycopg2
-from psycopg2 import pool, extras
+import asyncpg
 import os
-import json
-from contextlib import contextmanager
+import orjson
+from contextlib import asynccontextmanager
+from datetime import datetime
+from cachetools import TTLCache
 
 # Database configuration from environment variables
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
-    'port': os.getenv('DB_PORT', '5432'),
+    'port': int(os.getenv('DB_PORT', '5432')),
     'database': os.getenv('DB_NAME', 'verdant_db'),
     'user': os.getenv('DB_USER', 'verdant_user'),
     'password': os.getenv('DB_PASSWORD', 'verdant_pass')
@@ -19,13 +20,71 @@ DB_CONFIG = {
 # Connection pool
 connection_pool = None
 
-def init_db_pool(minconn=1, maxconn=10):
+# Pool sizing. Requests beyond max_size queue inside the pool until a
+# connection frees up, for at most DB_POOL_TIMEOUT seconds. Every Hypercorn
+# worker has its own pool, so DB_POOL_TOTAL_SIZE is the budget for all of them
+# together and must stay below PgBouncer's MAX_CLIENT_CONN; each worker gets
+# an equal share (at most 32) unless DB_POOL_MAX_SIZE is set. The worker count
+# is read the same way as in hypercorn_conf.py.
+DB_POOL_TOTAL_SIZE = int(os.getenv('DB_POOL_TOTAL_SIZE', '400'))
+WEB_WORKERS = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', str(max(1, min(32, DB_POOL_TOTAL_SIZE // WEB_WORKERS)))))
+DB_POOL_MIN_SIZE = min(int(os.getenv('DB_POOL_MIN_SIZE', '4')), DB_POOL_MAX_SIZE)
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+
+# asyncpg prepares every statement on first use and keeps it in a per-connection
+# LRU keyed by SQL text, so repeat calls skip parse/plan. Size the cache to hold
+# every query in this module; oversized one-off statements are not cached.
+STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+MAX_CACHEABLE_STATEMENT_SIZE = 32 * 1024
+
+# Menu rows change rarely but are read on nearly every page load. Cache them
+# in-process for a short TTL and clear the cache on every menu mutation; other
+# worker processes see changes once their entries expire.
+_menu_cache = TTLCache(maxsize=512, ttl=30)
+
+# User rows are read on almost every request. A 5 second TTL absorbs bursts of
+# parallel reads; every user mutation in this module evicts the entry.
+_user_cache = TTLCache(maxsize=10_000, ttl=5)
+
+# JSONB binary wire format is a one-byte version header followed by the JSON text
+JSONB_FORMAT_VERSION = b'\x01'
+
+def _encode_jsonb(value):
+    return JSONB_FORMAT_VERSION + orjson.dumps(value)
+
+def _decode_jsonb(data):
+    return orjson.loads(data[1:])
+
+async def _init_connection(conn):
+    """Install orjson codecs so JSON/JSONB columns round-trip as Python objects"""
+    # JSONB travels in binary so Postgres skips its text parser on the way in
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema='pg_catalog',
+        format='binary'
+    )
+    await conn.set_type_codec(
+        'json',
+        encoder=lambda value: orjson.dumps(value).decode('utf-8'),
+        decoder=orjson.loads,
+        schema='pg_catalog'
+    )
+
+async def init_db_pool(min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
     """Initialize the database connection pool"""
     global connection_pool
     try:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn,
-            maxconn,
+        connection_pool = await asyncpg.create_pool(
+            min_size=min_size,
+            max_size=max_size,
+            max_queries=50000,
+            max_inactive_connection_lifetime=600,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+            max_cacheable_statement_size=MAX_CACHEABLE_STATEMENT_SIZE,
+            init=_init_connection,
             **DB_CONFIG
         )
         print(f"✅ Database connection pool created successfully")
@@ -34,298 +93,512 @@ def init_db_pool(minconn=1, maxconn=10):
         print(f"❌ Error creating connection pool: {e}")
         return False
 
-@contextmanager
-def get_db_connection():
-    """Context manager for database connections"""
-    conn = None
-    try:
-        conn = connection_pool.getconn()
+async def close_db_pool():
+    """Close the database connection pool"""
+    global connection_pool
+    if connection_pool:
+        await connection_pool.close()
+        connection_pool = None
+
+@asynccontextmanager
+async def get_db_connection():
+    """Context manager for pooled database connections"""
+    async with connection_pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
         yield conn
-        conn.commit()
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise e
-    finally:
-        if conn:
-            connection_pool.putconn(conn)
-
-@contextmanager
-def get_db_cursor(commit=True):
-    """Context manager for database cursor with automatic commit/rollback"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor(cursor_factory=extras.RealDictCursor)
-        try:
-            yield cursor
-            if commit:
-                conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            cursor.close()
 
 # ===== USER OPERATIONS =====
 
-def get_user(user_id):
-    """Get user by ID"""
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        return dict(cursor.fetchone()) if cursor.rowcount > 0 else None
-
-def create_user(user_data):
+def invalidate_user_cache(user_id):
+    """Drop a cached user row after it changes"""
+    _user_cache.pop(user_id, None)
+
+def _refresh_user_cache(user_id, user):
+    """Cache the row an UPDATE ... RETURNING * produced, or evict if none came back"""
+    if user is None:
+        invalidate_user_cache(user_id)
+    else:
+        _user_cache[user_id] = user
+
+async def get_user(user_id, use_cache=True):
+    """Get user by ID; use_cache=False always reads the current row"""
+    user = _user_cache.get(user_id) if use_cache else None
+    if user is None:
+        async with get_db_connection() as conn:
+            user = await conn.fetchrow("SELECT * FROM users WHERE id = $1", user_id)
+        if user is not None:
+            _user_cache[user_id] = user
+    return user
+
+async def create_user(user_data):
     """Create a new user"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        return await conn.fetchrow("""
             INSERT INTO users (id, name, email, phone, address, wallet, green_points)
-            VALUES (%(id)s, %(name)s, %(email)s, %(phone)s, %(address)s, %(wallet)s, %(green_points)s)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
             RETURNING *
-        """, user_data)
-        return dict(cursor.fetchone())
+        """, user_data['id'], user_data['name'], user_data['email'], user_data['phone'],
+            user_data['address'], user_data['wallet'], user_data['green_points'])
+
+# Columns update_user may change; anything else is rejected before reaching SQL
+USER_UPDATABLE_COLUMNS = frozenset({
+    'name', 'email', 'phone', 'address', 'wallet', 'green_points',
+    'daily_protein_goal', 'daily_cal_goal', 'today_protein', 'today_cals',
+    'last_active_date'
+})
 
-def update_user(user_id, updates):
+async def update_user(user_id, updates):
     """Update user fields"""
-    set_clause = ', '.join([f"{k} = %s" for k in updates.keys()])
-    values = list(updates.values()) + [user_id]
-    
-    with get_db_cursor() as cursor:
-        cursor.execute(f"""
-            UPDATE users SET {set_clause}
-            WHERE id = %s
+    unknown = set(updates) - USER_UPDATABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Cannot update user columns: {', '.join(sorted(unknown))}")
+
+    # One fixed statement for every combination of fields, so it is prepared
+    # once; fields missing from the JSON object come back NULL and keep their value
+    async with get_db_connection() as conn:
+        user = await conn.fetchrow("""
+            UPDATE users u SET
+                name = COALESCE(p.name, u.name),
+                email = COALESCE(p.email, u.email),
+                phone = COALESCE(p.phone, u.phone),
+                address = COALESCE(p.address, u.address),
+                wallet = COALESCE(p.wallet, u.wallet),
+                green_points = COALESCE(p.green_points, u.green_points),
+                daily_protein_goal = COALESCE(p.daily_protein_goal, u.daily_protein_goal),
+                daily_cal_goal = COALESCE(p.daily_cal_goal, u.daily_cal_goal),
+                today_protein = COALESCE(p.today_protein, u.today_protein),
+                today_cals = COALESCE(p.today_cals, u.today_cals),
+                last_active_date = COALESCE(p.last_active_date, u.last_active_date)
+            FROM jsonb_populate_record(NULL::users, $1::jsonb) p
+            WHERE u.id = $2
+            RETURNING u.*
+        """, updates, user_id)
+    _refresh_user_cache(user_id, user)
+    return user
+
+async def finalize_daily_audit(user_id, deducted, today):
+    """Apply the daily audit penalty and reset daily tracking at most once per day; returns (user, applied)"""
+    async with get_db_connection() as conn:
+        # The penalty is relative so points earned meanwhile are kept, and the
+        # last_active_date guard makes a second audit for the same day a no-op
+        user = await conn.fetchrow("""
+            UPDATE users
+            SET green_points = GREATEST(green_points - $2, 0),
+                today_protein = 0,
+                today_cals = 0,
+                last_active_date = $3
+            WHERE id = $1 AND last_active_date IS DISTINCT FROM $3
             RETURNING *
-        """, values)
-        return dict(cursor.fetchone()) if cursor.rowcount > 0 else None
-
-def update_user_wallet(user_id, amount):
+        """, user_id, deducted, today)
+    if user is None:
+        # Another request already audited today (or the user is gone)
+        return await get_user(user_id, use_cache=False), False
+    _refresh_user_cache(user_id, user)
+    return user, True
+
+async def update_user_wallet(user_id, amount):
     """Update user wallet balance (atomic operation)"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            UPDATE users 
-            SET wallet = wallet + %s
-            WHERE id = %s AND wallet + %s >= 0
-            RETURNING wallet
-        """, (amount, user_id, amount))
-        result = cursor.fetchone()
-        return result['wallet'] if result else None
-
-def update_user_points(user_id, points):
+    async with get_db_connection() as conn:
+        user = await conn.fetchrow("""
+            UPDATE users
+            SET wallet = wallet + $1
+            WHERE id = $2 AND wallet + $1 >= 0
+            RETURNING *
+        """, amount, user_id)
+    _refresh_user_cache(user_id, user)
+    return user
+
+async def update_user_points(user_id, points):
     """Update user green points"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            UPDATE users 
-            SET green_points = green_points + %s
-            WHERE id = %s
-            RETURNING green_points
-        """, (points, user_id))
-        result = cursor.fetchone()
-        return result['green_points'] if result else None
+    async with get_db_connection() as conn:
+        user = await conn.fetchrow("""
+            UPDATE users
+            SET green_points = green_points + $1
+            WHERE id = $2
+            RETURNING *
+        """, points, user_id)
+    _refresh_user_cache(user_id, user)
+    return user
 
 # ===== MENU OPERATIONS =====
 
-def get_all_menu_items():
-    """Get all active menu items"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM menu_items 
-            WHERE is_active = TRUE
-            ORDER BY id
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+def invalidate_menu_cache():
+    """Drop cached menu reads after the menu changes"""
+    _menu_cache.clear()
 
-def get_menu_item(item_id):
+async def get_all_menu_items():
+    """Get all active menu items"""
+    items = _menu_cache.get('all')
+    if items is None:
+        async with get_db_connection() as conn:
+            items = await conn.fetch("""
+                SELECT * FROM menu_items
+                WHERE is_active = TRUE
+                ORDER BY id
+            """)
+        _menu_cache['all'] = items
+    return items
+
+async def get_menu_item(item_id):
     """Get menu item by ID"""
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT * FROM menu_items WHERE id = %s", (item_id,))
-        return dict(cursor.fetchone()) if cursor.rowcount > 0 else None
-
-def search_menu_items(query):
+    item = _menu_cache.get(('item', item_id))
+    if item is None:
+        async with get_db_connection() as conn:
+            item = await conn.fetchrow("SELECT * FROM menu_items WHERE id = $1", item_id)
+        if item is not None:
+            _menu_cache[('item', item_id)] = item
+    return item
+
+async def search_menu_items(query):
     """Search menu items by name or category"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM menu_items 
-            WHERE is_active = TRUE 
-            AND (name ILIKE %s OR category ILIKE %s)
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT * FROM menu_items
+            WHERE is_active = TRUE
+            AND (name ILIKE $1 OR category ILIKE $1)
             ORDER BY popularity DESC
-        """, (f'%{query}%', f'%{query}%'))
-        return [dict(row) for row in cursor.fetchall()]
+        """, f'%{query}%')
 
-def update_menu_stock(item_id, quantity_change):
+async def update_menu_stock(item_id, quantity_change):
     """Update menu item stock"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            UPDATE menu_items 
-            SET stock = stock + %s
-            WHERE id = %s AND stock + %s >= 0
-            RETURNING stock
-        """, (quantity_change, item_id, quantity_change))
-        result = cursor.fetchone()
-        return result['stock'] if result else None
-
-def add_menu_item(item_data):
+    async with get_db_connection() as conn:
+        item = await conn.fetchrow("""
+            UPDATE menu_items
+            SET stock = stock + $1
+            WHERE id = $2 AND stock + $1 >= 0
+            RETURNING *
+        """, quantity_change, item_id)
+    invalidate_menu_cache()
+    return item
+
+async def add_menu_item(item_data):
     """Add new menu item"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        item = await conn.fetchrow("""
             INSERT INTO menu_items (name, category, price, image, stock, calories, protein)
-            VALUES (%(name)s, %(category)s, %(price)s, %(image)s, %(stock)s, %(calories)s, %(protein)s)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
             RETURNING *
-        """, item_data)
-        return dict(cursor.fetchone())
+        """, item_data['name'], item_data['category'], item_data['price'], item_data['image'],
+            item_data['stock'], item_data['calories'], item_data['protein'])
+    invalidate_menu_cache()
+    return item
 
 # ===== ORDER OPERATIONS =====
 
-def create_order(order_data):
+async def create_order(order_data):
     """Create a new order"""
-    with get_db_cursor() as cursor:
-        # Convert items list to JSON string if it's not already
-        items_json = json.dumps(order_data['items']) if isinstance(order_data['items'], list) else order_data['items']
-        
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        # items is encoded by the JSONB codec registered in _init_connection
+        order = await conn.fetchrow("""
             INSERT INTO orders (id, user_id, items, total, points, status, user_name, address, phone)
-            VALUES (%(id)s, %(user_id)s, %(items)s, %(total)s, %(points)s, %(status)s, %(user_name)s, %(address)s, %(phone)s)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
             RETURNING *
-        """, {
-            'id': order_data['id'],
-            'user_id': order_data['user_id'],
-            'items': items_json,
-            'total': order_data['total'],
-            'points': order_data['points'],
-            'status': order_data['status'],
-            'user_name': order_data['user_name'],
-            'address': order_data['address'],
-            'phone': order_data['phone']
-        })
-        return dict(cursor.fetchone())
-
-def get_all_users():
-    """Get all users from database"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT id, name, email, phone, address, wallet, 
-                   green_points, daily_protein_goal, daily_cal_goal,
-                   today_protein, today_cals, created_at
+        """, order_data['id'], order_data['user_id'], order_data['items'], order_data['total'],
+            order_data['points'], order_data['status'], order_data['user_name'],
+            order_data['address'], order_data['phone'])
+    # The orders trigger bumps users.last_order_at
+    invalidate_user_cache(order_data['user_id'])
+    return order
+
+async def place_order_atomic(user_id, order_data, txn_data, nutrition):
+    """Debit wallet, credit points and nutrition, create order and log transaction in one statement"""
+    # Yields the order row plus new_wallet, new_points, today_protein and
+    # today_cals, or None (nothing written) when the user is missing or the
+    # wallet cannot cover the total. The order copies name/address/phone from
+    # the updated user row, so callers need not read the user first.
+    async with get_db_connection() as conn:
+        order = await conn.fetchrow("""
+            WITH w AS (
+                UPDATE users
+                SET wallet = wallet - $3::numeric,
+                    green_points = green_points + $5::int,
+                    today_protein = today_protein + $7::int,
+                    today_cals = today_cals + $8::int
+                WHERE id = $2 AND wallet - $3::numeric >= 0
+                RETURNING wallet, green_points, today_protein, today_cals, name, address, phone
+            ),
+            o AS (
+                INSERT INTO orders (id, user_id, items, total, points, status, user_name, address, phone)
+                SELECT $1::varchar, $2::varchar, $4::jsonb, $3::numeric, $5::int, $6::varchar,
+                       w.name, w.address, w.phone
+                FROM w
+                RETURNING *
+            ),
+            t AS (
+                INSERT INTO transactions (user_id, type, amount, description, payment_method, order_id)
+                SELECT o.user_id, $9::varchar, $10::numeric, $11::text, $12::varchar, o.id
+                FROM o
+            )
+            SELECT
+                w.wallet as new_wallet,
+                w.green_points as new_points,
+                w.today_protein,
+                w.today_cals,
+                o.*,
+                to_char(o.created_at, 'YYYY-MM-DD HH24:MI') as date_str,
+                o.total::float8 as total_f
+            FROM w, o
+        """, order_data['id'], user_id, order_data['total'], order_data['items'],
+            order_data['points'], order_data['status'], nutrition['protein'], nutrition['cals'],
+            txn_data['type'], txn_data['amount'], txn_data['description'], txn_data['payment_method'])
+    invalidate_user_cache(user_id)
+    return order
+
+# Keyset pagination: list queries walk (created_at, id) in descending order and
+# a page continues strictly after the key of the previous page's last row.
+# The first page starts from a sentinel key so every page reuses one prepared
+# statement. Order rows also carry date_str and total_f, already formatted for the API.
+FIRST_PAGE_KEY = (datetime.max, '')
+# Lower bound that every key satisfies, for reads that are not cut off at a page end
+LAST_PAGE_KEY = (datetime.min, '')
+
+async def get_all_users_numeric():
+    """Get every user's green points and whole-unit wallet as two parallel int lists"""
+    async with get_db_connection() as conn:
+        # Two int[] columns in one row instead of one Record per user
+        row = await conn.fetchrow("""
+            SELECT
+                COALESCE(array_agg(green_points ORDER BY created_at DESC, id DESC), '{}') as points,
+                COALESCE(array_agg(TRUNC(wallet)::int ORDER BY created_at DESC, id DESC), '{}') as wallets
             FROM users
-            ORDER BY created_at DESC
         """)
-        return [dict(row) for row in cursor.fetchall()]
-
-def get_user_orders(user_id, limit=10):
-    """Get user's orders"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM orders 
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (user_id, limit))
-        return [dict(row) for row in cursor.fetchall()]
-
-def get_all_orders(limit=50):
-    """Get all orders (for admin)"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM orders 
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (limit,))
-        return [dict(row) for row in cursor.fetchall()]
-
-def update_order_status(order_id, status):
+    return row['points'], row['wallets']
+
+async def get_user_orders(user_id, limit=10, after=None):
+    """Get user's orders, optionally one page after a (created_at, id) key"""
+    after_created_at, after_id = after or FIRST_PAGE_KEY
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT *,
+                to_char(created_at, 'YYYY-MM-DD HH24:MI') as date_str,
+                total::float8 as total_f
+            FROM orders
+            WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+            ORDER BY created_at DESC, id DESC
+            LIMIT $4
+        """, user_id, after_created_at, after_id, limit)
+
+async def get_all_orders(limit=50, after=None, until=None):
+    """Get all orders (for admin), optionally after a (created_at, id) key and down to an until key"""
+    after_created_at, after_id = after or FIRST_PAGE_KEY
+    until_created_at, until_id = until or LAST_PAGE_KEY
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT *,
+                to_char(created_at, 'YYYY-MM-DD HH24:MI') as date_str,
+                total::float8 as total_f
+            FROM orders
+            WHERE (created_at, id) < ($1, $2) AND (created_at, id) >= ($3, $4)
+            ORDER BY created_at DESC, id DESC
+            LIMIT $5
+        """, after_created_at, after_id, until_created_at, until_id, limit)
+
+async def get_orders_page_end(limit, after=None):
+    """Get the (created_at, id) key of the last order on a full page, or None if the page is short"""
+    after_created_at, after_id = after or FIRST_PAGE_KEY
+    async with get_db_connection() as conn:
+        # Reads only keys from idx_orders_created_at, so the page bounds are
+        # known before any row of the page is fetched
+        row = await conn.fetchrow("""
+            SELECT created_at, id
+            FROM orders
+            WHERE (created_at, id) < ($1, $2)
+            ORDER BY created_at DESC, id DESC
+            OFFSET $3
+            LIMIT 1
+        """, after_created_at, after_id, limit - 1)
+    return (row['created_at'], row['id']) if row else None
+
+async def update_order_status(order_id, status):
     """Update order status"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            UPDATE orders 
-            SET status = %s
-            WHERE id = %s
+    async with get_db_connection() as conn:
+        return await conn.fetchrow("""
+            UPDATE orders
+            SET status = $1
+            WHERE id = $2
             RETURNING *
-        """, (status, order_id))
-        return dict(cursor.fetchone()) if cursor.rowcount > 0 else None
+        """, status, order_id)
 
 # ===== TRANSACTION OPERATIONS =====
 
-def create_transaction(transaction_data):
+async def create_transaction(transaction_data):
     """Create a transaction record"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        return await conn.fetchrow("""
             INSERT INTO transactions (user_id, type, amount, description, payment_method, order_id)
-            VALUES (%(user_id)s, %(type)s, %(amount)s, %(description)s, %(payment_method)s, %(order_id)s)
+            VALUES ($1, $2, $3, $4, $5, $6)
             RETURNING *
-        """, transaction_data)
-        return dict(cursor.fetchone())
+        """, transaction_data['user_id'], transaction_data['type'], transaction_data['amount'],
+            transaction_data['description'], transaction_data['payment_method'],
+            transaction_data['order_id'])
 
-def get_user_transactions(user_id, limit=20):
+async def get_user_transactions(user_id, limit=20):
     """Get user's transaction history"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM transactions 
-            WHERE user_id = %s
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT * FROM transactions
+            WHERE user_id = $1
             ORDER BY created_at DESC
-            LIMIT %s
-        """, (user_id, limit))
-        return [dict(row) for row in cursor.fetchall()]
+            LIMIT $2
+        """, user_id, limit)
 
 # ===== REVIEW OPERATIONS =====
 
-def add_review(review_data):
+async def add_review(review_data):
     """Add a review for a menu item"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        return await conn.fetchrow("""
             INSERT INTO reviews (item_id, user_id, review_text, sentiment_score)
-            VALUES (%(item_id)s, %(user_id)s, %(review_text)s, %(sentiment_score)s)
+            VALUES ($1, $2, $3, $4)
             RETURNING *
-        """, review_data)
-        return dict(cursor.fetchone())
+        """, review_data['item_id'], review_data['user_id'], review_data['review_text'],
+            review_data['sentiment_score'])
 
-def get_item_reviews(item_id):
+async def get_item_reviews(item_id):
     """Get all reviews for a menu item"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
             SELECT r.*, u.name as user_name
             FROM reviews r
             JOIN users u ON r.user_id = u.id
-            WHERE r.item_id = %s
+            WHERE r.item_id = $1
             ORDER BY r.created_at DESC
-        """, (item_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        """, item_id)
 
-def get_item_average_sentiment(item_id):
+async def get_item_average_sentiment(item_id):
     """Get average sentiment score for an item"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
+    async with get_db_connection() as conn:
+        avg_sentiment = await conn.fetchval("""
             SELECT AVG(sentiment_score) as avg_sentiment
             FROM reviews
-            WHERE item_id = %s
-        """, (item_id,))
-        result = cursor.fetchone()
-        return float(result['avg_sentiment']) if result and result['avg_sentiment'] else 3.0
+            WHERE item_id = $1
+        """, item_id)
+        return float(avg_sentiment) if avg_sentiment else 3.0
+
+async def get_menu_with_avg_sentiment():
+    """Get active menu items with their average review sentiment (3.0 when unreviewed)"""
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT
+                m.id,
+                m.name,
+                m.stock,
+                m.stock * 2 as forecast,
+                ROUND(COALESCE(s.avg_sentiment, 3.0), 1)::float8 as sentiment
+            FROM menu_items m
+            LEFT JOIN (
+                SELECT item_id, AVG(sentiment_score) as avg_sentiment
+                FROM reviews
+                GROUP BY item_id
+            ) s ON s.item_id = m.id
+            WHERE m.is_active = TRUE
+            ORDER BY m.id
+        """)
 
 # ===== ANALYTICS OPERATIONS =====
 
-def get_order_frequency_by_item(days=30):
+async def get_admin_stats():
+    """Get order, user and menu totals for the admin dashboard in one row"""
+    async with get_db_connection() as conn:
+        return await conn.fetchrow("""
+            WITH o AS (
+                SELECT
+                    COUNT(*) as total_orders,
+                    COUNT(*) FILTER (WHERE status = 'Delivered') as delivered_orders,
+                    COUNT(*) FILTER (WHERE status IN ('Placed', 'Preparing', 'Out for Delivery')) as active_orders,
+                    COALESCE(SUM(total), 0) as total_revenue
+                FROM orders
+            ),
+            u AS (
+                SELECT
+                    COUNT(*) as total_users,
+                    COALESCE(SUM(green_points), 0) as total_green_points
+                FROM users
+            ),
+            m AS (
+                SELECT COUNT(*) as total_menu_items
+                FROM menu_items
+                WHERE is_active = TRUE
+            )
+            SELECT * FROM o, u, m
+        """)
+
+async def get_order_frequency_by_item(days=30):
     """Get order frequency per menu item over specified days"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT 
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT
                 mi.id,
                 mi.name,
                 mi.category,
                 mi.stock,
                 mi.price,
-                COUNT(o.id) as order_count,
-                SUM(jsonb_array_length(o.items)) as total_items_ordered
+                COUNT(DISTINCT oi.order_id) as order_count,
+                COALESCE(SUM(oi.qty), 0) as total_items_ordered
             FROM menu_items mi
-            LEFT JOIN orders o ON o.created_at >= NOW() - INTERVAL '%s days'
-                AND o.items::text LIKE '%%' || mi.name || '%%'
+            LEFT JOIN order_items oi ON oi.item_id = mi.id
+                AND oi.created_at >= NOW() - make_interval(days => $1)
             WHERE mi.is_active = TRUE
             GROUP BY mi.id, mi.name, mi.category, mi.stock, mi.price
             ORDER BY order_count DESC
-        """, (days,))
-        return [dict(row) for row in cursor.fetchall()]
-
-def get_low_stock_items(threshold=20):
+        """, days)
+
+async def get_food_prediction(days=30):
+    """Forecast 7-day demand per menu item and rank items by restock priority"""
+    async with get_db_connection() as conn:
+        # Rows come back in API shape: one per active item, critical first
+        return await conn.fetch("""
+            WITH demand AS (
+                SELECT item_id, COUNT(*) as total_orders
+                FROM order_items
+                WHERE created_at >= NOW() - make_interval(days => $1)
+                GROUP BY item_id
+            ),
+            rates AS (
+                SELECT
+                    m.id,
+                    m.name,
+                    m.category,
+                    m.stock,
+                    COALESCE(d.total_orders, 0) as total_orders,
+                    COALESCE(COALESCE(d.total_orders, 0)::float8 / NULLIF($1, 0), 0) as daily_avg
+                FROM menu_items m
+                LEFT JOIN demand d ON d.item_id = m.id
+                WHERE m.is_active = TRUE
+            ),
+            forecast AS (
+                SELECT
+                    rates.*,
+                    FLOOR(daily_avg * 7)::int as predicted_7day,
+                    CASE WHEN daily_avg > 0 THEN FLOOR(stock / daily_avg)::int ELSE 999 END as days_until_depletion
+                FROM rates
+            )
+            SELECT
+                id,
+                name,
+                category,
+                stock as current_stock,
+                ROUND(daily_avg::numeric, 2)::float8 as daily_avg_demand,
+                predicted_7day as predicted_7day_demand,
+                days_until_depletion,
+                predicted_7day > stock as restock_needed,
+                CASE
+                    WHEN days_until_depletion < 3 THEN 'critical'
+                    WHEN days_until_depletion < 7 THEN 'warning'
+                    ELSE 'normal'
+                END as priority,
+                total_orders as total_orders_last_30d
+            FROM forecast
+            ORDER BY
+                CASE WHEN days_until_depletion < 3 THEN 0 WHEN days_until_depletion < 7 THEN 1 ELSE 2 END,
+                predicted_7day DESC,
+                id
+        """, days)
+
+async def get_low_stock_items(threshold=20):
     """Get items below stock threshold"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT 
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT
                 id,
                 name,
                 category,
@@ -333,16 +606,76 @@ def get_low_stock_items(threshold=20):
                 price,
                 popularity
             FROM menu_items
-            WHERE is_active = TRUE AND stock <= %s
+            WHERE is_active = TRUE AND stock <= $1
             ORDER BY stock ASC
-        """, (threshold,))
-        return [dict(row) for row in cursor.fetchall()]
-
-def get_reviews_summary():
+        """, threshold)
+
+async def get_stock_alerts(threshold=30):
+    """Classify low-stock items by days of demand left over the last 30 days"""
+    async with get_db_connection() as conn:
+        # Rows come back in API shape, most urgent first
+        return await conn.fetch("""
+            WITH demand AS (
+                SELECT item_id, COUNT(DISTINCT order_id) as order_count
+                FROM order_items
+                WHERE created_at >= NOW() - INTERVAL '30 days'
+                GROUP BY item_id
+            ),
+            rates AS (
+                SELECT
+                    m.id,
+                    m.name,
+                    m.category,
+                    m.stock,
+                    m.popularity,
+                    COALESCE(d.order_count, 0)::float8 / 30 as daily_demand
+                FROM menu_items m
+                LEFT JOIN demand d ON d.item_id = m.id
+                WHERE m.is_active = TRUE AND m.stock <= $1
+            ),
+            remaining AS (
+                SELECT
+                    rates.*,
+                    CASE WHEN daily_demand > 0 THEN FLOOR(stock / daily_demand)::int ELSE 999 END as days_remaining
+                FROM rates
+            ),
+            levels AS (
+                SELECT
+                    remaining.*,
+                    CASE
+                        WHEN days_remaining < 2 OR stock < 10 THEN 'critical'
+                        WHEN days_remaining < 5 OR stock < 20 THEN 'warning'
+                        ELSE 'info'
+                    END as alert_level
+                FROM remaining
+            )
+            SELECT
+                id,
+                name,
+                category,
+                stock as current_stock,
+                ROUND(daily_demand::numeric, 2)::float8 as daily_demand,
+                days_remaining,
+                alert_level,
+                CASE alert_level
+                    WHEN 'critical' THEN format('URGENT: Only %s units left!', stock)
+                    WHEN 'warning' THEN format('Low stock: %s units remaining', stock)
+                    ELSE format('Stock level: %s units', stock)
+                END as message,
+                CASE WHEN daily_demand > 0 THEN FLOOR(daily_demand * 14)::int ELSE 50 END as recommended_restock,
+                popularity
+            FROM levels
+            ORDER BY
+                CASE alert_level WHEN 'critical' THEN 0 WHEN 'warning' THEN 1 ELSE 2 END,
+                days_remaining,
+                stock
+        """, threshold)
+
+async def get_reviews_summary():
     """Get aggregated review statistics per item"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT 
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT
                 mi.id,
                 mi.name,
                 mi.category,
@@ -356,129 +689,117 @@ def get_reviews_summary():
             HAVING COUNT(r.id) > 0
             ORDER BY avg_sentiment DESC
         """)
-        return [dict(row) for row in cursor.fetchall()]
 
-def get_trending_items(min_reviews=3):
+async def get_trending_items(min_reviews=3):
     """Get items with recent sentiment changes (trending positive or negative)"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            WITH recent_reviews AS (
-                SELECT 
-                    item_id,
-                    AVG(sentiment_score) as recent_sentiment
-                FROM reviews
-                WHERE created_at >= NOW() - INTERVAL '7 days'
-                GROUP BY item_id
-                HAVING COUNT(*) >= %s
-            ),
-            all_reviews AS (
-                SELECT 
-                    item_id,
-                    AVG(sentiment_score) as overall_sentiment
-                FROM reviews
-                GROUP BY item_id
-            )
-            SELECT 
-                mi.id,
-                mi.name,
-                mi.category,
-                ar.overall_sentiment,
-                rr.recent_sentiment,
-                (rr.recent_sentiment - ar.overall_sentiment) as sentiment_change
-            FROM menu_items mi
-            JOIN recent_reviews rr ON rr.item_id = mi.id
-            JOIN all_reviews ar ON ar.item_id = mi.id
-            WHERE mi.is_active = TRUE
-            ORDER BY ABS(rr.recent_sentiment - ar.overall_sentiment) DESC
+    async with get_db_connection() as conn:
+        # Precomputed by mv_trending_items, see refresh_analytics_views()
+        return await conn.fetch("""
+            SELECT
+                id,
+                name,
+                category,
+                overall_sentiment,
+                recent_sentiment,
+                sentiment_change
+            FROM mv_trending_items
+            WHERE recent_review_count >= $1
+            ORDER BY ABS(sentiment_change) DESC
             LIMIT 10
-        """, (min_reviews,))
-        return [dict(row) for row in cursor.fetchall()]
-
-def get_order_items_analysis(days=30):
-    """Analyze items from orders to calculate demand"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                o.created_at::date as order_date,
-                item->>'name' as item_name,
+        """, min_reviews)
+
+async def get_daily_forecast(days=7):
+    """Count ordered items per day and category"""
+    async with get_db_connection() as conn:
+        return await conn.fetch("""
+            SELECT
+                oi.created_at::date as order_date,
+                to_char(oi.created_at::date, 'Dy') as day,
+                COALESCE(mi.category, 'Other') as category,
                 COUNT(*) as order_count
-            FROM orders o,
-            jsonb_array_elements(o.items) as item
-            WHERE o.created_at >= NOW() - INTERVAL '%s days'
-            GROUP BY o.created_at::date, item->>'name'
+            FROM order_items oi
+            LEFT JOIN menu_items mi ON mi.id = oi.item_id AND mi.is_active = TRUE
+            WHERE oi.created_at >= NOW() - make_interval(days => $1)
+            GROUP BY 1, 2, 3
             ORDER BY order_date DESC, order_count DESC
-        """, (days,))
-        return [dict(row) for row in cursor.fetchall()]
-
-
+        """, days)
 
 # ===== INTELLIGENCE & ANALYTICS =====
 
-def get_menu_analysis():
+# Materialized views behind the admin dashboards (defined in migrations/001_analytics_schema.sql)
+ANALYTICS_VIEWS = ('mv_trending_items', 'mv_menu_analysis')
+ANALYTICS_REFRESH_LOCK_ID = 7_301_001
+
+async def get_menu_analysis():
     """Get menu items with popularity and price for BCG Matrix"""
-    with get_db_cursor() as cursor:
-        # Join menu with order counts to determine popularity
-        # Assumes item names in orders match menu names
-        cursor.execute("""
-            SELECT 
-                m.id,
-                m.name, 
-                m.price, 
-                m.category,
-                COUNT(item) as popularity
-            FROM menu_items m
-            LEFT JOIN orders o ON o.created_at > NOW() - INTERVAL '30 days'
-            LEFT JOIN jsonb_array_elements(o.items) as item ON item->>'name' = m.name
-            WHERE m.is_active = TRUE
-            GROUP BY m.id
+    async with get_db_connection() as conn:
+        # Precomputed by mv_menu_analysis (menu joined with 30-day order_items counts)
+        return await conn.fetch("""
+            SELECT id, name, price, category, popularity
+            FROM mv_menu_analysis
         """)
-        return [dict(row) for row in cursor.fetchall()]
 
-def get_inactive_users(days=14):
+async def refresh_analytics_views():
+    """Refresh the analytics materialized views; skipped if another worker holds the lock"""
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", ANALYTICS_REFRESH_LOCK_ID):
+                return False
+            for view in ANALYTICS_VIEWS:
+                await execute_query(f'refresh_{view}', fetch=False, conn=conn)
+            return True
+
+async def get_inactive_users(days=14):
     """Find users who haven't ordered in X days (Churn Risk)"""
-    with get_db_cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                u.id, 
-                u.name, 
-                u.email, 
+    async with get_db_connection() as conn:
+        # last_active is formatted server-side so rows serialize as-is
+        return await conn.fetch("""
+            SELECT
+                u.id,
+                u.name,
+                u.email,
                 u.wallet,
-                MAX(o.created_at) as last_active
+                COALESCE(to_char(u.last_order_at, 'YYYY-MM-DD"T"HH24:MI:SS'), 'Never') as last_active
             FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id
-            GROUP BY u.id
-            HAVING MAX(o.created_at) < NOW() - INTERVAL '%s days' 
-                OR MAX(o.created_at) IS NULL
+            WHERE u.last_order_at < NOW() - make_interval(days => $1)
+                OR u.last_order_at IS NULL
             ORDER BY u.wallet DESC
-        """, (days,))
-        # Convert datetime to string for JSON serialization
-        results = []
-        for row in cursor.fetchall():
-            d = dict(row)
-            if d['last_active']:
-                d['last_active'] = d['last_active'].isoformat()
-            else:
-                d['last_active'] = "Never"
-            results.append(d)
-        return results
+        """, days)
 
 # ===== UTILITY FUNCTIONS =====
 
-def execute_query(query, params=None, fetch=True):
-    """Execute a custom query"""
-    with get_db_cursor() as cursor:
-        cursor.execute(query, params or ())
-        if fetch:
-            return [dict(row) for row in cursor.fetchall()]
-        return cursor.rowcount
+# Ad-hoc statements callers may run through execute_query, by ID. Callers can
+# no longer send arbitrary SQL, and each template stays a single prepared statement.
+_ALLOWED_QUERIES = {
+    'refresh_mv_trending_items': "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_trending_items",
+    'refresh_mv_menu_analysis': "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_menu_analysis",
+}
 
-def test_connection():
+async def execute_query(query_id, params=None, fetch=True, conn=None):
+    """Execute an allow-listed query by its ID, on conn if given (e.g. inside a transaction)"""
+    try:
+        query = _ALLOWED_QUERIES[query_id]
+    except KeyError:
+        raise ValueError(f"Unknown query ID: {query_id}") from None
+
+    if conn is None:
+        async with get_db_connection() as conn:
+            return await _run_query(conn, query, params, fetch)
+    return await _run_query(conn, query, params, fetch)
+
+async def _run_query(conn, query, params, fetch):
+    if fetch:
+        return await conn.fetch(query, *(params or ()))
+    status = await conn.execute(query, *(params or ()))
+    # Status strings look like "UPDATE 3"; the trailing token is the row count
+    return int(status.split()[-1]) if status.split()[-1].isdigit() else 0
+
+async def test_connection():
     """Test database connection"""
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT version();")
-            version = cursor.fetchone()
-            print(f"✅ Database connected: {version['version']}")
+        async with get_db_connection() as conn:
+            version = await conn.fetchval("SELECT version();")
+            print(f"✅ Database connected: {version}")
             return True
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
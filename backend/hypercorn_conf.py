@@ -0,0 +1,20 @@
+"""
+Hypercorn settings for running the Quart app in production:
+
+    hypercorn --config file:hypercorn_conf.py server:app
+"""
+import os
+
+bind = [os.getenv('BIND', '0.0.0.0:5000')]
+
+# Each worker is a separate process with its own event loop, asyncpg pool and
+# in-process caches. Handlers are async and C calls run in threads, so one
+# worker per core is enough to use every CPU.
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+worker_class = 'asyncio'
+
+keep_alive_timeout = 5
+graceful_timeout = 10
+
+accesslog = None
+errorlog = '-'
@@ -1,5 +1,5 @@
 -- Verdant Database Initialization Script
--- PostgreSQL 16
+-- PostgreSQL 18
 
 -- Create Users Table
 CREATE TABLE IF NOT EXISTS users (
@@ -78,15 +78,18 @@ CREATE TABLE IF NOT EXISTS reviews (
 );
 
 -- Create Indexes for Performance
-CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);
-CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC);
+-- Composite (filter, sort) indexes let per-user/per-item "latest N" queries
+-- read rows in order instead of sorting them
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
-CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_reviews_item_id ON reviews(item_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_item_created ON reviews(item_id, created_at DESC) INCLUDE (sentiment_score);
 CREATE INDEX IF NOT EXISTS idx_reviews_user_id ON reviews(user_id);
 CREATE INDEX IF NOT EXISTS idx_menu_items_category ON menu_items(category);
 CREATE INDEX IF NOT EXISTS idx_menu_items_active ON menu_items(is_active);
+CREATE INDEX IF NOT EXISTS idx_menu_items_low_stock ON menu_items(stock) WHERE is_active = TRUE;
 
 -- Create Updated At Trigger Function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -392,3 +395,6 @@ INSERT INTO reviews (item_id, user_id, review_text, sentiment_score) VALUES
 (40, 'user_9', 'Egg benedict is perfectly poached.', 4.7),
 (40, 'user_10', 'Delicious and elegant!', 4.6)
 ON CONFLICT DO NOTHING;
+
+-- Refresh planner statistics now that the seed data and indexes are in place
+ANALYZE;
@@ -0,0 +1,184 @@
+-- Analytics schema migration
+-- Brings an existing database up to the schema the backend expects. It runs
+-- in one transaction and every statement is idempotent, so the file can be
+-- re-run safely. On a fresh volume docker-compose runs it right after
+-- init.sql; for an existing one:
+--   docker exec -i verdant-postgres psql -U verdant_user -d verdant_db \
+--     -v ON_ERROR_STOP=1 < backend/migrations/001_analytics_schema.sql
+
+BEGIN;
+
+-- Track Each User's Latest Order
+-- Denormalized from orders so churn lookups filter users directly
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_order_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_users_last_order_at ON users(last_order_at NULLS FIRST);
+
+-- Create Last Order Trigger Function
+CREATE OR REPLACE FUNCTION update_user_last_order()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE users
+    SET last_order_at = GREATEST(last_order_at, NEW.created_at)
+    WHERE id = NEW.user_id;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- Add Trigger to Track Each User's Latest Order
+DROP TRIGGER IF EXISTS update_orders_user_last_order ON orders;
+CREATE TRIGGER update_orders_user_last_order AFTER INSERT ON orders
+    FOR EACH ROW EXECUTE FUNCTION update_user_last_order();
+
+-- Backfill Last Order Times from Existing Orders
+UPDATE users u
+SET last_order_at = o.last_order_at
+FROM (
+    SELECT user_id, MAX(created_at) as last_order_at
+    FROM orders
+    GROUP BY user_id
+) o
+WHERE u.id = o.user_id
+    AND (u.last_order_at IS NULL OR u.last_order_at < o.last_order_at);
+
+-- Create Order Items Table
+-- One row per element of orders.items, maintained by a trigger, so analytics
+-- can GROUP BY item instead of unnesting JSONB at query time
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id VARCHAR(50) REFERENCES orders(id) ON DELETE CASCADE,
+    item_id INTEGER REFERENCES menu_items(id) ON DELETE SET NULL,
+    name VARCHAR(100),
+    qty INTEGER DEFAULT 1,
+    price DECIMAL(10, 2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create Order Items Indexes
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_item_created ON order_items(item_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_created_at ON order_items(created_at);
+
+-- Create Order Items Trigger Function
+-- Every cast is guarded so malformed item JSON is recorded as NULLs instead of
+-- aborting the order; unknown menu IDs get a NULL item_id
+CREATE OR REPLACE FUNCTION insert_order_items()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO order_items (order_id, item_id, name, qty, price, created_at)
+    SELECT
+        NEW.id,
+        mi.id,
+        LEFT(item->>'name', 100),
+        CASE WHEN item->>'qty' ~ '^\d{1,9}$' THEN (item->>'qty')::int ELSE 1 END,
+        CASE WHEN item->>'price' ~ '^\d{1,7}(\.\d+)?$' THEN (item->>'price')::numeric END,
+        NEW.created_at
+    FROM jsonb_array_elements(
+        CASE WHEN jsonb_typeof(NEW.items) = 'array' THEN NEW.items ELSE '[]'::jsonb END
+    ) as item
+    LEFT JOIN menu_items mi
+        ON mi.id = CASE WHEN item->>'id' ~ '^\d{1,9}$' THEN (item->>'id')::int END;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- Add Trigger to Normalize Order Items
+DROP TRIGGER IF EXISTS insert_orders_order_items ON orders;
+CREATE TRIGGER insert_orders_order_items AFTER INSERT ON orders
+    FOR EACH ROW EXECUTE FUNCTION insert_order_items();
+
+-- Backfill Order Items for Orders Placed Before the Trigger Existed
+-- Items without a usable menu ID (such as the seed orders) are linked by name
+INSERT INTO order_items (order_id, item_id, name, qty, price, created_at)
+SELECT
+    o.id,
+    COALESCE(by_id.id, by_name.id),
+    LEFT(item->>'name', 100),
+    CASE WHEN item->>'qty' ~ '^\d{1,9}$' THEN (item->>'qty')::int ELSE 1 END,
+    CASE WHEN item->>'price' ~ '^\d{1,7}(\.\d+)?$' THEN (item->>'price')::numeric END,
+    o.created_at
+FROM orders o
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(o.items) = 'array' THEN o.items ELSE '[]'::jsonb END
+) as item
+LEFT JOIN menu_items by_id
+    ON by_id.id = CASE WHEN item->>'id' ~ '^\d{1,9}$' THEN (item->>'id')::int END
+LEFT JOIN LATERAL (
+    SELECT mi.id FROM menu_items mi
+    WHERE mi.name = item->>'name'
+    ORDER BY mi.id
+    LIMIT 1
+) by_name ON by_id.id IS NULL
+WHERE NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id);
+
+ANALYZE order_items;
+
+-- Materialized Views for Analytics Dashboards
+-- Refreshed CONCURRENTLY by the backend every few minutes; the unique
+-- indexes are required for concurrent refresh
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_trending_items AS
+WITH recent_reviews AS (
+    SELECT
+        item_id,
+        AVG(sentiment_score) as recent_sentiment,
+        COUNT(*) as recent_review_count
+    FROM reviews
+    WHERE created_at >= NOW() - INTERVAL '7 days'
+    GROUP BY item_id
+),
+all_reviews AS (
+    SELECT
+        item_id,
+        AVG(sentiment_score) as overall_sentiment
+    FROM reviews
+    GROUP BY item_id
+)
+SELECT
+    mi.id,
+    mi.name,
+    mi.category,
+    ar.overall_sentiment,
+    rr.recent_sentiment,
+    rr.recent_review_count,
+    (rr.recent_sentiment - ar.overall_sentiment) as sentiment_change
+FROM menu_items mi
+JOIN recent_reviews rr ON rr.item_id = mi.id
+JOIN all_reviews ar ON ar.item_id = mi.id
+WHERE mi.is_active = TRUE;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_trending_items_id ON mv_trending_items(id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_menu_analysis AS
+SELECT
+    m.id,
+    m.name,
+    m.price,
+    m.category,
+    COUNT(oi.id) as popularity
+FROM menu_items m
+LEFT JOIN order_items oi ON oi.item_id = m.id
+    AND oi.created_at > NOW() - INTERVAL '30 days'
+WHERE m.is_active = TRUE
+GROUP BY m.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_menu_analysis_id ON mv_menu_analysis(id);
+
+-- Drop Unused Indexes
+-- No query filters or sorts users by created_at alone
+DROP INDEX IF EXISTS idx_users_created_at;
+
+-- Cover Review Sentiment with the Per-Item Review Index
+-- sentiment_score rides along in idx_reviews_item_created, so the separate
+-- per-item sentiment index is redundant
+DROP INDEX IF EXISTS idx_reviews_item_sentiment;
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE indexname = 'idx_reviews_item_created' AND indexdef LIKE '%INCLUDE (sentiment_score)%'
+    ) THEN
+        DROP INDEX IF EXISTS idx_reviews_item_created;
+        CREATE INDEX idx_reviews_item_created ON reviews(item_id, created_at DESC) INCLUDE (sentiment_score);
+    END IF;
+END $$;
+
+COMMIT;
@@ -3,82 +3,161 @@
 # Last Updated: Jan 2026
 # TODO: Add rate limiting for production deployment
 
-import ctypes
+import asyncio
+import base64
 import os
 import sys
-from flask import Flask, jsonify, request
-from flask_cors import CORS
+from quart import Quart, jsonify, request
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
 from werkzeug.utils import secure_filename
 from datetime import datetime, date
+from decimal import Decimal
+from asyncpg import Record
 import uuid
-import json
+from functools import wraps
+from collections import Counter
+from cachetools import TTLCache
+import orjson
+import numpy as np
 
 # Database operations module
 import database as db
 
+# C AI engine bindings (K-Means, TSP, nutrition scoring)
+import ai_engine as ai
+
 # Setup working directory
 # This ensures relative paths work correctly in Docker
 base_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(base_dir) 
 print(f"[INFO] Server working directory: {base_dir}")
 
-# Load C library for performance-critical AI operations
-# Note: We use C for K-Means, TSP, and nutrition scoring (10-100x faster than Python)
-lib_file = "verdant_backend.dll" if sys.platform.startswith('win') else "verdant_backend.so"
-lib_path = os.path.join(base_dir, lib_file)
-
-lib = None
-if not os.path.exists(lib_path):
-    print(f"[WARNING] C library not found: {lib_file}")
-    print("[INFO] Server will start but AI features will be disabled")
-    print("[FIX] Rebuild with: docker-compose up -d --build backend")
-else:
-    try:
-        lib = ctypes.CDLL(lib_path)
-        print(f"[SUCCESS] C library loaded: {lib_file}")
-    except OSError as e:
-        print(f"[WARNING] Error loading C library: {e}")
-        print("[INFO] Server will start but AI features will be disabled")
+# --- FLASK APP SETUP ---
+UPLOAD_FOLDER = os.path.join(base_dir, 'static/uploads')
+if not os.path.exists(UPLOAD_FOLDER): 
+    os.makedirs(UPLOAD_FOLDER)
 
+def _json_default(obj):
+    """Serialize types orjson does not handle natively"""
+    if isinstance(obj, Record):
+        return dict(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
-# C Function bindings
-# These are the performance-critical functions we moved to C
-# Everything else uses Python for easier maintenance
-# TODO: Consider adding caching layer for frequently called functions
+# Stringify non-str dict keys the way the stdlib encoder does
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
 
-if lib:
-    lib.optimize_route.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
-    lib.analyze_nutrition.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
-    lib.calculate_daily_audit.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson; DB rows are serialized without dict copies"""
 
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_json_default, option=ORJSON_OPTIONS).decode('utf-8')
 
-# --- FLASK APP SETUP ---
-UPLOAD_FOLDER = os.path.join(base_dir, 'static/uploads')
-if not os.path.exists(UPLOAD_FOLDER): 
-    os.makedirs(UPLOAD_FOLDER)
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
-app = Flask(__name__, static_folder='static')
-CORS(app)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=_json_default, option=ORJSON_OPTIONS), mimetype=self.mimetype)
 
-# --- DATABASE INITIALIZATION ---
-print("=== Initializing PostgreSQL Database Connection ===")
-if not db.init_db_pool():
-    print("❌ Failed to initialize database. Exiting...")
-    sys.exit(1)
+# List endpoints page with keyset cursors returned in this header, so response
+# bodies keep their shape; pass it back as ?cursor= to get the next page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def encode_cursor(key):
+    """Encode a (created_at, id) page key as an opaque cursor string"""
+    created_at, row_id = key
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), row_id])).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+app = Quart(__name__, static_folder='static')
+app = cors(app, expose_headers=[NEXT_CURSOR_HEADER])
+app.json = ORJSONProvider(app)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-if not db.test_connection():
-    print("❌ Database connection test failed. Exiting...")
-    sys.exit(1)
+# Admin aggregates are derived data that dashboards poll repeatedly. Successful
+# responses are kept in memory per query string and dropped whenever orders or
+# stock change; other worker processes catch up when their entries expire.
+_response_caches = []
+
+def cached_response(ttl):
+    """Serve a GET handler's successful JSON response from memory for `ttl` seconds"""
+    cache = TTLCache(maxsize=32, ttl=ttl)
+    _response_caches.append(cache)
+
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            key = request.query_string
+            body = cache.get(key)
+            if body is not None:
+                return app.response_class(body, mimetype='application/json')
+            response = await app.make_response(await handler(*args, **kwargs))
+            if response.status_code == 200:
+                cache[key] = await response.get_data()
+            return response
+        return wrapper
+    return decorator
+
+def invalidate_response_cache():
+    """Drop cached admin aggregates after orders, stock or the menu change"""
+    for cache in _response_caches:
+        cache.clear()
 
-print("✅ Database ready - All data stored in PostgreSQL")
+# --- DATABASE INITIALIZATION ---
+@app.before_serving
+async def init_database():
+    """Create the asyncpg pool on the serving event loop"""
+    print("=== Initializing PostgreSQL Database Connection ===")
+    if not await db.init_db_pool():
+        print("❌ Failed to initialize database. Exiting...")
+        sys.exit(1)
+
+    if not await db.test_connection():
+        print("❌ Database connection test failed. Exiting...")
+        sys.exit(1)
+
+    print("✅ Database ready - All data stored in PostgreSQL")
+
+    global analytics_refresh_task
+    analytics_refresh_task = asyncio.create_task(refresh_analytics_views())
+
+@app.after_serving
+async def close_database():
+    if analytics_refresh_task:
+        analytics_refresh_task.cancel()
+    await db.close_db_pool()
+
+# Admin dashboards read precomputed materialized views; keep them fresh
+ANALYTICS_REFRESH_SECONDS = 300
+analytics_refresh_task = None
+
+async def refresh_analytics_views():
+    """Refresh the analytics materialized views every few minutes"""
+    while True:
+        try:
+            await db.refresh_analytics_views()
+        except Exception as e:
+            print(f"[WARNING] Analytics view refresh failed: {e}")
+        await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
 
 # ============================================================================
 # API ROUTES
 # ============================================================================
 
 @app.route('/')
-def index(): 
+async def index(): 
     return jsonify({
         "status": "Verdant Major Project API", 
         "version": "2.0", 
@@ -88,10 +167,11 @@ def index():
 
 # --- AUTHENTICATION ---
 @app.route('/api/login', methods=['POST'])
-def login():
+async def login():
     """Simple login endpoint - can be enhanced with database authentication"""
-    username = request.json.get('u', '')
-    password = request.json.get('p', '')
+    data = await request.get_json()
+    username = data.get('u', '')
+    password = data.get('p', '')
     
     if username == 'admin' and password == 'admin123':
         return jsonify({"success": True, "role": "admin"})
@@ -102,15 +182,15 @@ def login():
 
 # --- MENU OPERATIONS ---
 @app.route('/api/menu')
-def menu():
+async def menu():
     """Get all menu items or search menu items"""
     try:
         q = request.args.get('search')
         
         if q:
-            items = db.search_menu_items(q)
+            items = await db.search_menu_items(q)
         else:
-            items = db.get_all_menu_items()
+            items = await db.get_all_menu_items()
         
         menu_items = []
         for item in items:
@@ -132,156 +212,169 @@ def menu():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/add', methods=['POST'])
-def add_menu_item():
+async def add_menu_item():
     """Add new menu item (Admin only)"""
     try:
-        f = request.files.get('img')
+        files = await request.files
+        form = await request.form
+        f = files.get('img')
         path = "https://placehold.co/400"
         
         if f:
             fn = secure_filename(f.filename)
-            f.save(os.path.join(app.config['UPLOAD_FOLDER'], fn))
+            await f.save(os.path.join(app.config['UPLOAD_FOLDER'], fn))
             path = f"/static/uploads/{fn}"
         
         item_data = {
-            'name': request.form['name'],
-            'category': request.form['cat'],
-            'price': float(request.form['price']),
+            'name': form['name'],
+            'category': form['cat'],
+            'price': float(form['price']),
             'image': path,
-            'stock': int(request.form.get('stock', 100)),
-            'calories': int(request.form.get('calories', 0)),
-            'protein': int(request.form.get('protein', 0))
+            'stock': int(form.get('stock', 100)),
+            'calories': int(form.get('calories', 0)),
+            'protein': int(form.get('protein', 0))
         }
         
-        db.add_menu_item(item_data)
+        await db.add_menu_item(item_data)
+        invalidate_response_cache()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/restock', methods=['POST'])
-def restock():
+async def restock():
     """Update menu item stock"""
     try:
-        item_id = int(request.json['id'])
-        qty = int(request.json['qty'])
+        data = await request.get_json()
+        item_id = int(data['id'])
+        qty = int(data['qty'])
         
-        new_stock = db.update_menu_stock(item_id, qty)
+        item = await db.update_menu_stock(item_id, qty)
         
-        if new_stock is not None:
-            return jsonify({"success": True, "new_stock": new_stock})
+        if item is not None:
+            invalidate_response_cache()
+            return jsonify({"success": True, "new_stock": item['stock']})
         return jsonify({"error": "Failed to update stock"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # --- AI/ANALYTICS FUNCTIONS (Using C Library) ---
+# The C engine seeds delivery locations from the clock, so a route only has to
+# stay reasonably fresh; reuse each stop count's solution for a short TTL.
+# The C functions already write JSON, so their output is sent as-is.
+ROUTE_CACHE_SECONDS = 30
+_route_cache = TTLCache(maxsize=64, ttl=ROUTE_CACHE_SECONDS)
+
 @app.route('/api/route', methods=['GET'])
-def get_route():
+async def get_route():
     """Get optimized delivery route using 2-Opt algorithm"""
-    if not lib:
+    if not ai.lib:
         return jsonify({"error": "AI engine not available", "stops": [], "total_distance": 0}), 503
     try:
         stops = int(request.args.get('stops', 12))
-        buffer = ctypes.create_string_buffer(8192)
-        lib.optimize_route(stops, buffer, 8192)
-        return jsonify(json.loads(buffer.value.decode('utf-8')))
+        route = _route_cache.get(stops)
+        if route is None:
+            route = await asyncio.to_thread(ai.optimize_route, stops)
+            _route_cache[stops] = route
+        return app.response_class(route, mimetype='application/json')
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/nutrition', methods=['POST'])
-def analyze_nutrition():
+async def analyze_nutrition():
     """Analyze nutrition data and provide bio-score"""
-    if not lib:
+    if not ai.lib:
         return jsonify({"verdict": "AI Unavailable", "bio_score": 50}), 503
     try:
-        data = request.json
-        buffer = ctypes.create_string_buffer(2048)
-        lib.analyze_nutrition(
+        data = await request.get_json()
+        result = ai.analyze_nutrition(
             int(data.get('protein', 0)), 
             int(data.get('carbs', 0)), 
             int(data.get('fat', 0)), 
             int(data.get('fiber', 0)), 
-            int(data.get('sodium', 0)),
-            buffer, 2048
+            int(data.get('sodium', 0))
         )
-        return jsonify(json.loads(buffer.value.decode('utf-8')))
+        return app.response_class(result, mimetype='application/json')
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/audit', methods=['POST'])
-def daily_audit():
+async def daily_audit():
     """Calculate daily habit audit and point penalties"""
-    if not lib:
-        return jsonify({"penalty_applied": false, "new_points": 0}), 503
+    if not ai.lib:
+        return jsonify({"penalty_applied": False, "new_points": 0}), 503
     try:
-        data = request.json
-        buffer = ctypes.create_string_buffer(1024)
-        lib.calculate_daily_audit(
+        data = await request.get_json()
+        result = ai.calculate_daily_audit(
             int(data.get('points', 0)),
             int(data.get('protein_consumed', 0)),
             int(data.get('protein_goal', 0)),
             int(data.get('carbs_consumed', 0)),
-            int(data.get('carbs_goal', 0)),
-            buffer, 1024
+            int(data.get('carbs_goal', 0))
         )
-        return jsonify(json.loads(buffer.value.decode('utf-8')))
+        return app.response_class(result, mimetype='application/json')
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # --- USER MANAGEMENT ---
 @app.route('/api/user', methods=['GET'])
-def get_user():
+async def get_user():
     """Get user profile and order history"""
     try:
         user_id = request.args.get('id', 'user_1')
-        user = db.get_user(user_id)
+        try:
+            orders_after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        user = await db.get_user(user_id)
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         # Daily habit audit check
-        today_str = date.today().isoformat()
+        today = date.today()
         penalty_msg = None
         
-        if lib and user['last_active_date'] and user['last_active_date'].isoformat() != today_str:
-            buffer = ctypes.create_string_buffer(1024)
-            lib.calculate_daily_audit(
+        if ai.lib and user['last_active_date'] and user['last_active_date'] != today:
+            # The audit decides a write, so base it on the current row, not one
+            # that may be seconds old or cached by another worker
+            user = await db.get_user(user_id, use_cache=False)
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+        
+        if ai.lib and user['last_active_date'] and user['last_active_date'] != today:
+            audit_res = orjson.loads(ai.calculate_daily_audit(
                 user['green_points'],
                 user['today_protein'],
                 user['daily_protein_goal'],
                 user['today_cals'],
-                user['daily_cal_goal'],
-                buffer, 1024
-            )
-            audit_res = json.loads(buffer.value.decode('utf-8'))
+                user['daily_cal_goal']
+            ))
             
-            if audit_res.get("penalty_applied"):
-                db.update_user(user_id, {'green_points': audit_res['new_points']})
-                penalty_msg = f"Missed goals yesterday! {audit_res.get('deducted')} pts deducted."
+            deducted = audit_res.get('deducted', 0) if audit_res.get("penalty_applied") else 0
             
-            # Reset daily tracking
-            db.update_user(user_id, {
-                'today_protein': 0,
-                'today_cals': 0,
-                'last_active_date': today_str
-            })
-            user = db.get_user(user_id)
+            # Apply any penalty and reset daily tracking in one statement; only
+            # the request that actually applied it reports the penalty
+            user, applied = await db.finalize_daily_audit(user_id, deducted, today)
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+            if applied and deducted:
+                penalty_msg = f"Missed goals yesterday! {deducted} pts deducted."
         
         # Get order history
-        orders = db.get_user_orders(user_id, limit=10)
-        
-        formatted_orders = []
-        for order in orders:
-            formatted_orders.append({
-                "id": order['id'],
-                "user_id": order['user_id'],
-                "items": order['items'],
-                "total": float(order['total']),
-                "points": order['points'],
-                "status": order['status'],
-                "date": order['created_at'].strftime("%Y-%m-%d %H:%M")
-            })
-        
-        return jsonify({
+        orders = await db.get_user_orders(user_id, limit=10, after=orders_after)
+        
+        formatted_orders = [{
+            "id": order['id'],
+            "user_id": order['user_id'],
+            "items": order['items'],
+            "total": order['total_f'],
+            "points": order['points'],
+            "status": order['status'],
+            "date": order['date_str']
+        } for order in orders]
+        
+        response = jsonify({
             "profile": {
                 "id": user['id'],
                 "name": user['name'],
@@ -299,15 +392,18 @@ def get_user():
             "orders": formatted_orders,
             "penalty_alert": penalty_msg
         })
+        if len(orders) == 10:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor((orders[-1]['created_at'], orders[-1]['id']))
+        return response
     except Exception as e:
         print(f"Error in /api/user: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/user/set_goals', methods=['POST'])
-def set_goals():
+async def set_goals():
     """Set user's daily nutrition goals"""
     try:
-        data = request.json
+        data = await request.get_json()
         user_id = data.get('user_id', 'user_1')
         
         updates = {
@@ -315,7 +411,7 @@ def set_goals():
             'daily_cal_goal': int(data.get('cals', 0))
         }
         
-        user = db.update_user(user_id, updates)
+        user = await db.update_user(user_id, updates)
         
         if user:
             return jsonify({"success": True, "profile": user})
@@ -325,10 +421,10 @@ def set_goals():
 
 # --- WALLET OPERATIONS ---
 @app.route('/api/wallet/add', methods=['POST'])
-def add_funds():
+async def add_funds():
     """Add funds to user wallet"""
     try:
-        data = request.json
+        data = await request.get_json()
         user_id = data.get('user_id', 'user_1')
         amount = float(data.get('amount', 0))
         payment_method = data.get('payment_method', 'upi')
@@ -337,11 +433,11 @@ def add_funds():
             return jsonify({"error": "Invalid amount"}), 400
         
         # Update wallet atomically
-        new_balance = db.update_user_wallet(user_id, amount)
+        user = await db.update_user_wallet(user_id, amount)
         
-        if new_balance is not None:
+        if user is not None:
             # Create transaction record
-            db.create_transaction({
+            await db.create_transaction({
                 'user_id': user_id,
                 'type': 'credit',
                 'amount': amount,
@@ -350,7 +446,7 @@ def add_funds():
                 'order_id': None
             })
             
-            return jsonify({"success": True, "new_balance": float(new_balance)})
+            return jsonify({"success": True, "new_balance": float(user['wallet'])})
         
         return jsonify({"error": "Failed to update wallet"}), 500
     except Exception as e:
@@ -358,62 +454,47 @@ def add_funds():
 
 # --- ORDER OPERATIONS ---
 @app.route('/api/order/place', methods=['POST'])
-def place_order():
+async def place_order():
     """Place a new order"""
     try:
-        data = request.json
+        data = await request.get_json()
         user_id = data.get('user_id', 'user_1')
         items = data.get('items', [])
         
-        user = db.get_user(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Order has no items"}), 400
+        
         total_price = sum(float(i.get('price', 0)) for i in items)
         total_points = sum(i.get('points', 0) for i in items)
         
-        if user['wallet'] < total_price:
-            return jsonify({"error": "Insufficient Funds"}), 402
-
-        # Deduct from wallet
-        new_wallet = db.update_user_wallet(user_id, -total_price)
-        if new_wallet is None:
-            return jsonify({"error": "Failed to deduct from wallet"}), 500
-        
-        # Add points
-        new_points = db.update_user_points(user_id, total_points)
-        
-        # Update daily nutrition tracking
-        today_protein = user['today_protein'] + sum(i.get('protein', 0) for i in items)
-        today_cals = user['today_cals'] + sum(i.get('cals', 0) for i in items)
-        db.update_user(user_id, {
-            'today_protein': today_protein,
-            'today_cals': today_cals
-        })
+        if total_price <= 0:
+            return jsonify({"error": "Invalid order total"}), 400
 
-        # Create order
+        # Deduct from wallet, add points and daily nutrition, create the order
+        # and record the transaction in one atomic round trip
         order_id = "ORD-" + str(uuid.uuid4())[:8].upper()
-        new_order = db.create_order({
+        new_order = await db.place_order_atomic(user_id, {
             "id": order_id,
-            "user_id": user_id,
-            "user_name": user['name'],
-            "address": user['address'],
-            "phone": user['phone'],
             "items": items,
             "total": total_price,
             "points": total_points,
             "status": "Placed"
-        })
-        
-        # Create transaction record
-        db.create_transaction({
-            'user_id': user_id,
+        }, {
             'type': 'debit',
             'amount': total_price,
             'description': f'Order {order_id}',
-            'payment_method': 'wallet',
-            'order_id': order_id
+            'payment_method': 'wallet'
+        }, {
+            # Daily totals are whole numbers; round rather than let a cast truncate
+            'protein': round(sum(float(i.get('protein', 0)) for i in items)),
+            'cals': round(sum(float(i.get('cals', 0)) for i in items))
         })
+        if new_order is None:
+            # Nothing was written; only now find out why
+            if not await db.get_user(user_id):
+                return jsonify({"error": "User not found"}), 404
+            return jsonify({"error": "Insufficient Funds"}), 402
+        invalidate_response_cache()
         
         return jsonify({
             "success": True,
@@ -424,85 +505,123 @@ def place_order():
                 "address": new_order['address'],
                 "phone": new_order['phone'],
                 "items": new_order['items'],
-                "total": float(new_order['total']),
+                "total": new_order['total_f'],
                 "points": new_order['points'],
-                "date": new_order['created_at'].strftime("%Y-%m-%d %H:%M"),
+                "date": new_order['date_str'],
                 "status": new_order['status']
             },
-            "new_wallet": float(new_wallet),
-            "new_points": new_points,
-            "today_protein": today_protein,
-            "today_cals": today_cals
+            "new_wallet": float(new_order['new_wallet']),
+            "new_points": new_order['new_points'],
+            "today_protein": new_order['today_protein'],
+            "today_cals": new_order['today_cals']
         })
     except Exception as e:
         print(f"Error in /api/order/place: {e}")
         return jsonify({"error": str(e)}), 500
 
 # --- ADMIN OPERATIONS ---
+# Large pages are streamed: rows are read in keyset chunks, each on a connection
+# that is released before the chunk is encoded and sent
+ADMIN_ORDERS_PAGE_SIZE = 50
+ADMIN_ORDERS_MAX_PAGE_SIZE = 5000
+ADMIN_ORDERS_CHUNK_SIZE = 500
+
+def format_admin_order(order):
+    return {
+        "id": order['id'],
+        "user_id": order['user_id'],
+        "user_name": order['user_name'],
+        "address": order['address'],
+        "phone": order['phone'],
+        "items": order['items'],
+        "total": order['total_f'],
+        "points": order['points'],
+        "status": order['status'],
+        "date": order['date_str']
+    }
+
+async def stream_admin_orders(limit, after, until):
+    """Yield one page of orders as a JSON array, a chunk at a time"""
+    yield b'['
+    sent = 0
+    while sent < limit:
+        size = min(ADMIN_ORDERS_CHUNK_SIZE, limit - sent)
+        orders = await db.get_all_orders(limit=size, after=after, until=until)
+        if orders:
+            body = b','.join(
+                orjson.dumps(format_admin_order(order), default=_json_default, option=ORJSON_OPTIONS)
+                for order in orders
+            )
+            yield body if sent == 0 else b',' + body
+            sent += len(orders)
+            after = (orders[-1]['created_at'], orders[-1]['id'])
+        if len(orders) < size:
+            break
+    yield b']'
+
 @app.route('/api/admin/orders', methods=['GET'])
-def get_all_orders():
+async def get_all_orders():
     """Get all orders (Admin only)"""
     try:
-        orders = db.get_all_orders(limit=50)
-        
-        formatted_orders = []
-        for order in orders:
-            formatted_orders.append({
-                "id": order['id'],
-                "user_id": order['user_id'],
-                "user_name": order['user_name'],
-                "address": order['address'],
-                "phone": order['phone'],
-                "items": order['items'],
-                "total": float(order['total']),
-                "points": order['points'],
-                "status": order['status'],
-                "date": order['created_at'].strftime("%Y-%m-%d %H:%M")
-            })
-        
-        return jsonify(formatted_orders)
+        try:
+            after = decode_cursor(request.args.get('cursor'))
+            limit = int(request.args.get('limit', ADMIN_ORDERS_PAGE_SIZE))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        limit = max(1, min(limit, ADMIN_ORDERS_MAX_PAGE_SIZE))
+
+        if limit <= ADMIN_ORDERS_CHUNK_SIZE:
+            # Small pages are read in one go; a full page means there may be another one
+            orders = await db.get_all_orders(limit=limit, after=after)
+            response = jsonify([format_admin_order(order) for order in orders])
+            if len(orders) == limit:
+                response.headers[NEXT_CURSOR_HEADER] = encode_cursor((orders[-1]['created_at'], orders[-1]['id']))
+            return response
+
+        # The key of the page's last row is looked up first so the cursor can
+        # go in the headers; None means the page is not full and is the last
+        until = await db.get_orders_page_end(limit, after)
+        response = app.response_class(stream_admin_orders(limit, after, until), mimetype='application/json')
+        if until is not None:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(until)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/admin/order/update', methods=['POST'])
-def update_order():
+async def update_order():
     """Update order status (Admin only)"""
     try:
-        data = request.json
+        data = await request.get_json()
         order_id = data.get('order_id')
         status = data.get('status')
         
-        updated_order = db.update_order_status(order_id, status)
+        updated_order = await db.update_order_status(order_id, status)
         
         if updated_order:
+            invalidate_response_cache()
             return jsonify({"success": True})
         return jsonify({"error": "Order not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/admin/stats', methods=['GET'])
-def admin_stats():
+@cached_response(ttl=30)
+async def admin_stats():
     """Calculate real-time admin statistics from database"""
     try:
-        orders = db.get_all_orders(limit=1000)
-        users = db.get_all_users()
-        menu = db.get_all_menu_items()
-        
-        total_revenue = sum(order['total'] for order in orders)
-        active_orders = len([o for o in orders if o['status'] in ['Placed', 'Preparing', 'Out for Delivery']])
-        delivered_orders = len([o for o in orders if o['status'] == 'Delivered'])
-        co2_saved = delivered_orders * 0.5
-        total_green_points = sum(user['green_points'] for user in users)
+        stats = await db.get_admin_stats()
+        co2_saved = stats['delivered_orders'] * 0.5
         
         return jsonify({
-            'total_users': len(users),
-            'total_revenue': round(total_revenue, 2),
-            'active_orders': active_orders,
-            'total_menu_items': len(menu),
+            'total_users': stats['total_users'],
+            'total_revenue': round(float(stats['total_revenue']), 2),
+            'active_orders': stats['active_orders'],
+            'total_menu_items': stats['total_menu_items'],
             'co2_saved': round(co2_saved, 2),
-            'total_orders': len(orders),
-            'delivered_orders': delivered_orders,
-            'total_green_points': total_green_points
+            'total_orders': stats['total_orders'],
+            'delivered_orders': stats['delivered_orders'],
+            'total_green_points': stats['total_green_points']
         })
     except Exception as e:
         print(f"Error in /api/admin/stats: {e}")
@@ -510,151 +629,46 @@ def admin_stats():
 
 # --- ANALYTICS ---
 @app.route('/api/analytics')
-def analytics():
+@cached_response(ttl=60)
+async def analytics():
     """Get menu analytics with sentiment scores"""
     try:
-        items = db.get_all_menu_items()
-        data = []
-        
-        for item in items:
-            avg_sentiment = db.get_item_average_sentiment(item['id'])
-            
-            data.append({
-                "id": item['id'],
-                "name": item['name'],
-                "stock": item['stock'],
-                "forecast": item['stock'] * 2,  # Simple forecast
-                "sentiment": round(avg_sentiment, 1)
-            })
-        
-        return jsonify(data)
+        # Rows already have the response shape; forecast is a simple stock * 2
+        items = await db.get_menu_with_avg_sentiment()
+        return jsonify(items)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # --- ADMIN ANALYTICS ---
 @app.route('/api/admin/food-prediction', methods=['GET'])
-def food_prediction():
+@cached_response(ttl=600)
+async def food_prediction():
     """Predict food demand based on historical orders"""
     try:
         days = int(request.args.get('days', 30))
         
-        # Get order items analysis
-        order_items = db.get_order_items_analysis(days)
-        
-        # Calculate demand per item
-        item_demand = {}
-        for order in order_items:
-            item_name = order['item_name']
-            if item_name not in item_demand:
-                item_demand[item_name] = {'total_orders': 0, 'dates': []}
-            item_demand[item_name]['total_orders'] += order['order_count']
-            item_demand[item_name]['dates'].append(order['order_date'])
-        
-        # Get current menu items
-        menu_items = db.get_all_menu_items()
-        
-        predictions = []
-        for item in menu_items:
-            demand_data = item_demand.get(item['name'], {'total_orders': 0, 'dates': []})
-            total_orders = demand_data['total_orders']
-            
-            # Calculate daily average and predict next 7 days
-            daily_avg = total_orders / days if days > 0 else 0
-            predicted_7day = int(daily_avg * 7)
-            
-            # Calculate days until stock depletion
-            days_until_depletion = int(item['stock'] / daily_avg) if daily_avg > 0 else 999
-            
-            # Determine restock priority
-            if days_until_depletion < 3:
-                priority = 'critical'
-            elif days_until_depletion < 7:
-                priority = 'warning'
-            else:
-                priority = 'normal'
-            
-            predictions.append({
-                'id': item['id'],
-                'name': item['name'],
-                'category': item['category'],
-                'current_stock': item['stock'],
-                'daily_avg_demand': round(daily_avg, 2),
-                'predicted_7day_demand': predicted_7day,
-                'days_until_depletion': days_until_depletion,
-                'restock_needed': predicted_7day > item['stock'],
-                'priority': priority,
-                'total_orders_last_30d': total_orders
-            })
-        
-        # Sort by priority and demand
-        priority_order = {'critical': 0, 'warning': 1, 'normal': 2}
-        predictions.sort(key=lambda x: (priority_order[x['priority']], -x['predicted_7day_demand']))
-        
+        predictions = await db.get_food_prediction(days)
         return jsonify(predictions)
     except Exception as e:
         print(f"Error in /api/admin/food-prediction: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/admin/stock-requirements', methods=['GET'])
-def stock_requirements():
+async def stock_requirements():
     """Analyze stock requirements and generate alerts"""
     try:
         threshold = int(request.args.get('threshold', 30))
         
-        # Get low stock items
-        low_stock = db.get_low_stock_items(threshold)
-        
-        # Get order frequency to calculate demand
-        order_freq = db.get_order_frequency_by_item(30)
-        freq_map = {item['name']: item for item in order_freq}
-        
-        alerts = []
-        for item in low_stock:
-            freq_data = freq_map.get(item['name'], {})
-            order_count = freq_data.get('order_count', 0)
-            
-            # Calculate demand rate
-            daily_demand = order_count / 30 if order_count > 0 else 0
-            days_remaining = int(item['stock'] / daily_demand) if daily_demand > 0 else 999
-            
-            # Determine alert level
-            if days_remaining < 2 or item['stock'] < 10:
-                alert_level = 'critical'
-                message = f"URGENT: Only {item['stock']} units left!"
-            elif days_remaining < 5 or item['stock'] < 20:
-                alert_level = 'warning'
-                message = f"Low stock: {item['stock']} units remaining"
-            else:
-                alert_level = 'info'
-                message = f"Stock level: {item['stock']} units"
-            
-            # Calculate recommended restock amount (2 weeks supply)
-            recommended_restock = int(daily_demand * 14) if daily_demand > 0 else 50
-            
-            alerts.append({
-                'id': item['id'],
-                'name': item['name'],
-                'category': item['category'],
-                'current_stock': item['stock'],
-                'daily_demand': round(daily_demand, 2),
-                'days_remaining': days_remaining,
-                'alert_level': alert_level,
-                'message': message,
-                'recommended_restock': recommended_restock,
-                'popularity': item['popularity']
-            })
-        
-        # Sort by alert level and days remaining
-        alert_priority = {'critical': 0, 'warning': 1, 'info': 2}
-        alerts.sort(key=lambda x: (alert_priority[x['alert_level']], x['days_remaining']))
+        alerts = await db.get_stock_alerts(threshold)
+        levels = Counter(alert['alert_level'] for alert in alerts)
         
         return jsonify({
             'alerts': alerts,
             'summary': {
                 'total_low_stock': len(alerts),
-                'critical': len([a for a in alerts if a['alert_level'] == 'critical']),
-                'warning': len([a for a in alerts if a['alert_level'] == 'warning']),
-                'info': len([a for a in alerts if a['alert_level'] == 'info'])
+                'critical': levels['critical'],
+                'warning': levels['warning'],
+                'info': levels['info']
             }
         })
     except Exception as e:
@@ -662,48 +676,51 @@ def stock_requirements():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/admin/reviews-analysis', methods=['GET'])
-def reviews_analysis():
+@cached_response(ttl=120)
+async def reviews_analysis():
     """Analyze reviews and sentiment data"""
     try:
         # Get reviews summary
-        reviews_summary = db.get_reviews_summary()
+        reviews_summary = await db.get_reviews_summary()
         
         # Get trending items
-        trending = db.get_trending_items(min_reviews=2)
+        trending = await db.get_trending_items(min_reviews=2)
         
-        # Categorize items by sentiment
-        top_rated = []
-        low_rated = []
+        # Convert sentiments and counts once; every bucket below is a vectorized pass
+        sentiments = np.fromiter((float(item['avg_sentiment']) for item in reviews_summary),
+                                 dtype=np.float64, count=len(reviews_summary))
+        review_counts = np.fromiter((item['review_count'] for item in reviews_summary),
+                                    dtype=np.int64, count=len(reviews_summary))
         
-        for item in reviews_summary:
-            avg_sentiment = float(item['avg_sentiment'])
-            review_count = item['review_count']
-            
-            item_data = {
+        def format_item(i):
+            item = reviews_summary[i]
+            return {
                 'id': item['id'],
                 'name': item['name'],
                 'category': item['category'],
-                'avg_sentiment': round(avg_sentiment, 2),
-                'review_count': review_count,
+                'avg_sentiment': round(float(sentiments[i]), 2),
+                'review_count': int(review_counts[i]),
                 'last_review': item['last_review_date'].strftime("%Y-%m-%d") if item['last_review_date'] else None
             }
-            
-            if avg_sentiment >= 4.5 and review_count >= 3:
-                top_rated.append(item_data)
-            elif avg_sentiment < 3.5 and review_count >= 2:
-                low_rated.append(item_data)
+        
+        # Categorize items by sentiment
+        top_mask = (sentiments >= 4.5) & (review_counts >= 3)
+        low_mask = (sentiments < 3.5) & (review_counts >= 2)
+        top_rated = [format_item(i) for i in np.flatnonzero(top_mask)]
+        low_rated = [format_item(i) for i in np.flatnonzero(low_mask)]
         
         # Sort top rated by sentiment, low rated by review count (more reviews = more urgent)
         top_rated.sort(key=lambda x: (-x['avg_sentiment'], -x['review_count']))
         low_rated.sort(key=lambda x: (-x['review_count'], x['avg_sentiment']))
         
         # Calculate sentiment distribution
+        counts, _ = np.histogram(sentiments, bins=[-np.inf, 3.0, 3.5, 4.0, 4.5, np.inf])
         sentiment_distribution = {
-            'excellent': len([r for r in reviews_summary if float(r['avg_sentiment']) >= 4.5]),
-            'good': len([r for r in reviews_summary if 4.0 <= float(r['avg_sentiment']) < 4.5]),
-            'average': len([r for r in reviews_summary if 3.5 <= float(r['avg_sentiment']) < 4.0]),
-            'poor': len([r for r in reviews_summary if 3.0 <= float(r['avg_sentiment']) < 3.5]),
-            'critical': len([r for r in reviews_summary if float(r['avg_sentiment']) < 3.0])
+            'excellent': int(counts[4]),
+            'good': int(counts[3]),
+            'average': int(counts[2]),
+            'poor': int(counts[1]),
+            'critical': int(counts[0])
         }
         
         # Format trending items
@@ -724,7 +741,7 @@ def reviews_analysis():
             'low_rated': low_rated[:10],
             'trending': trending_items,
             'sentiment_distribution': sentiment_distribution,
-            'total_reviews': sum(item['review_count'] for item in reviews_summary),
+            'total_reviews': int(review_counts.sum()),
             'total_items_reviewed': len(reviews_summary)
         })
     except Exception as e:
@@ -734,41 +751,22 @@ def reviews_analysis():
 
 # --- MOCK DATA ENDPOINTS (For frontend charts) ---
 @app.route('/api/forecast')
-def forecast():
+@cached_response(ttl=300)
+async def forecast():
     """Return forecast data for charts based on real order history"""
     try:
-        # Get menu items to map names to categories
-        menu_items = db.get_all_menu_items()
-        item_category_map = {item['name']: item['category'] for item in menu_items}
+        # Per-day, per-category counts for the last 7 days, aggregated in SQL
+        rows = await db.get_daily_forecast(days=7)
         
-        # Get raw data from DB (last 7 days)
-        raw_data = db.get_order_items_analysis(days=7)
-        
-        # Process data into frontend format with category breakdown
+        # Pivot into frontend format with category breakdown
         daily_stats = {}
         
-        for row in raw_data:
-            date_str = row['order_date'].strftime("%a")  # Mon, Tue...
-            item_name = row['item_name']
-            count = row['order_count']
-            
-            # Get category for this item
-            category = item_category_map.get(item_name, 'Other')
-            
-            if date_str not in daily_stats:
-                daily_stats[date_str] = {
-                    "day": date_str,
-                    "total": 0,
-                    "carbon_saved": 0
-                }
-            
-            daily_stats[date_str]["total"] += count
-            daily_stats[date_str]["carbon_saved"] += (count * 0.5)
-            
-            # Add category breakdown
-            if category not in daily_stats[date_str]:
-                daily_stats[date_str][category] = 0
-            daily_stats[date_str][category] += count
+        for row in rows:
+            day, category, count = row['day'], row['category'], row['order_count']
+            stats = daily_stats.setdefault(day, {"day": day, "total": 0, "carbon_saved": 0})
+            stats["total"] += count
+            stats["carbon_saved"] += count * 0.5
+            stats[category] = stats.get(category, 0) + count
 
         # If empty, return safe structure
         if not daily_stats:
@@ -779,41 +777,26 @@ def forecast():
         return jsonify(list(daily_stats.values()))
     except Exception as e:
         print(f"Error in forecast: {e}")
-        return jsonify([])
-
-# Binding for new Clustering AI
-if lib:
-    lib.perform_clustering.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int), ctypes.c_char_p, ctypes.c_int]
+        # Charts still get a list, and the 500 keeps the fallback out of the cache
+        return jsonify([]), 500
 
 @app.route('/api/matrix')
-def matrix():
+async def matrix():
     """Return customer clustering data using C-based K-Means on real DB data"""
-    if not lib:
+    if not ai.lib:
         return jsonify([]), 503
     try:
         # 1. Fetch real user data from Database
-        users = db.get_all_users()
-        count = len(users)
+        points, wallets = await db.get_all_users_numeric()
         
-        if count == 0:
+        if not points:
             return jsonify([])
 
-        # 2. Prepare C-compatible arrays
-        points_array = (ctypes.c_int * count)()
-        orders_array = (ctypes.c_int * count)()
-        
-        for i, user in enumerate(users):
-            points_array[i] = int(user['green_points'])
-            orders_array[i] = int(user['wallet']) 
-
-        # 3. Call C AI Engine
-        buffer_size = 16384 # 16KB for JSON output
-        buffer = ctypes.create_string_buffer(buffer_size)
-        
-        lib.perform_clustering(count, points_array, orders_array, buffer, buffer_size)
+        # 2. Call C AI Engine (off the event loop; ctypes releases the GIL)
+        result = await asyncio.to_thread(ai.perform_clustering, points, wallets)
         
-        # 4. Return result
-        return jsonify(json.loads(buffer.value.decode('utf-8')))
+        # 3. Return the engine's JSON as-is
+        return app.response_class(result, mimetype='application/json')
 
     except Exception as e:
         print(f"Error in /api/matrix: {e}")
@@ -821,20 +804,20 @@ def matrix():
         return jsonify([])
 
 @app.route('/api/admin/intelligence/menu-matrix')
-def menu_matrix():
+async def menu_matrix():
     """Get Menu Engineering Data (BCG Matrix)"""
     try:
-        data = db.get_menu_analysis()
+        data = await db.get_menu_analysis()
         return jsonify(data)
     except Exception as e:
         print(f"Error in menu-matrix: {e}")
         return jsonify([])
 
 @app.route('/api/admin/intelligence/churn-risk')
-def churn_risk():
+async def churn_risk():
     """Get High Risk Users (Inactive > 14 days)"""
     try:
-        data = db.get_inactive_users(days=14)
+        data = await db.get_inactive_users(days=14)
         return jsonify(data)
     except Exception as e:
         print(f"Error in churn-risk: {e}")
@@ -852,4 +835,5 @@ if __name__ == '__main__':
     print(f"🤖 AI Engine: C Library (Nutrition, Logistics, Routes)")
     print(f"🌐 Server: http://0.0.0.0:5000")
     print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False, threaded=True)
+    # Local development only; production runs under Hypercorn (see hypercorn_conf.py)
+    app.run(debug=os.getenv('FLASK_ENV') != 'production', host='0.0.0.0', port=5000, use_reloader=False)